@@ -1,15 +1,42 @@
-import re
+import io
+import json
+import asyncio
+import regex
 import discord
 import logging
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
 from random import random
 from emoji import is_emoji
 from redbot.core import commands, Config
 from redbot.core.bot import Red
 from redbot.core.utils.views import SimpleMenu
-from typing import Optional, Union
+from typing import Iterable, Optional, Union
+from .matcher import PatternMatcher, PatternStore, shadow_evaluate
+from .dispatcher import ReactionDispatcher, Emoji
+from .stats import PatternStats, bucket_label
 
 log = logging.getLogger("red.crab-cogs.autoreact")
 
+PATTERN_TIMEOUT = 0.05  # seconds a single regex may run on a message
+MESSAGE_BUDGET = 0.2  # seconds all regexes together may run on a message
+QUARANTINE_STRIKES = 3  # timeouts before a regex is quarantined
+MATCH_WORKERS = 2
+TEST_BUDGET = 1.0  # seconds [p]autoreact test may spend trying a pattern
+MAX_PENDING_MATCHES = 16
+VALID_MESSAGE_TTL = 60.0
+VALID_MESSAGE_CACHE_SIZE = 10000
+# Red core commands that change the outcome of is_valid_red_message
+PERMISSION_COMMANDS = ("allowlist", "blocklist", "localallowlist", "localblocklist", "ignore", "unignore")
+COG_TOGGLE_COMMANDS = ("command enablecog", "command disablecog", "command defaultenablecog", "command defaultdisablecog")
+STATS_FLUSH_INTERVAL = 300  # seconds between saving pattern stats
+MAX_RESIDENT_GUILDS = 1000  # guilds whose compiled patterns stay in memory
+MAX_PATTERN_LENGTH = 400
+RECENT_MESSAGES = 200  # message contents kept per guild to test new patterns against
+TRACKED_MESSAGES = 5000  # messages whose autoreacts are remembered in case they get edited
+MAX_IMPORT_SIZE = 1024 * 1024
+
 def batched(lst: list, n: int):
     for i in range(0, len(lst), n):
         yield lst[i:i + n]
@@ -17,6 +44,41 @@ def batched(lst: list, n: int):
 def is_regional_indicator(string: str):
     return string.strip() in "🇦🇧🇨🇩🇪🇫🇬🇭🇮🇯🇰🇱🇲🇳🇴🇵🇶🇷🇸🇹🇺🇻🇼🇽🇾🇿"
 
+def parse_autoreacts(text: str) -> list[tuple[str, str]]:
+    """Reads a JSON object of emojis to patterns, or lines of an emoji followed by a pattern."""
+    try:
+        data = json.loads(text)
+    except ValueError:
+        data = None
+    if isinstance(data, dict):
+        return [(str(emoji), str(pattern)) for emoji, pattern in data.items()]
+    entries = []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        emoji, _, pattern = line.strip().partition(" ")
+        pattern = pattern.strip()
+        if pattern.startswith('`') and pattern.endswith('`'):
+            pattern = pattern.strip('`')
+        entries.append((emoji, pattern))
+    return entries
+
+def compile_patterns(entries: list[tuple[str, str]]) -> tuple[dict[str, regex.Pattern], list[str]]:
+    compiled, errors = {}, []
+    for emoji, pattern in entries:
+        try:
+            compiled[emoji] = regex.compile(pattern)
+        except Exception as error:
+            errors.append(f"{emoji} invalid regex pattern: {error}")
+    return compiled, errors
+
+def build_matcher(store: PatternStore, autoreact_regexes: dict[str, str], quarantined: list[str]) -> PatternMatcher:
+    matcher = PatternMatcher(store)
+    matcher.update(autoreact_regexes)
+    for emoji in quarantined:
+        matcher.quarantine(emoji)
+    return matcher
+
 
 class Autoreact(commands.Cog):
     """Lets you configure emojis that will be added to any message containing text matching a regex."""
@@ -25,48 +87,207 @@ class Autoreact(commands.Cog):
         super().__init__()
         self.bot = bot
         self.config = Config.get_conf(self, identifier=61757472)
-        self.autoreacts: dict[int, dict[str, re.Pattern]] = {}
-        self.coreact_chance: dict[int, float] = {}
-        self.config.register_guild(autoreact_regexes={}, coreact_chance=0.0)
+        self.autoreacts: OrderedDict[int, PatternMatcher] = OrderedDict()
+        self.empty_guilds: set[int] = set()  # guilds known to have no autoreacts, kept out of the LRU
+        self.loading_guilds: dict[int, asyncio.Task] = {}
+        self.pattern_store = PatternStore()
+        self.empty_matcher = PatternMatcher(self.pattern_store)  # shared by every guild in empty_guilds, never mutated
+        self.recent_messages: OrderedDict[int, deque[tuple[int, str]]] = OrderedDict()
+        self.applied_reactions: OrderedDict[int, set[str]] = OrderedDict()
+        self.usable_emojis: set[int] = set()
+        self.emoji_index_ready = False
+        self.emoji_index_task: Optional[asyncio.Task] = None
+        self.coreact_chance: OrderedDict[int, float] = OrderedDict()
+        self.pattern_stats: dict[int, dict[str, PatternStats]] = {}
+        self.dirty_stats: set[int] = set()
+        self.flush_task: Optional[asyncio.Task] = None
+        self.executor = ThreadPoolExecutor(max_workers=MATCH_WORKERS, thread_name_prefix="autoreact")
+        self.test_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="autoreact-test")
+        self.match_slots = asyncio.Semaphore(MAX_PENDING_MATCHES)
+        self.valid_message_cache: dict[tuple[int, int, int], tuple[bool, float]] = {}
+        self.dispatcher = ReactionDispatcher(self.on_reaction_error)
+        self.config.register_guild(autoreact_regexes={}, coreact_chance=0.0, quarantined=[], pattern_stats={})
 
     async def cog_load(self):
-        all_config = await self.config.all_guilds()
-        self.autoreacts = {guild_id: {emoji: re.compile(text) for emoji, text in conf['autoreact_regexes'].items()}
-                           for guild_id, conf in all_config.items()}
-        self.coreact_chance = {guild_id: conf['coreact_chance'] for guild_id, conf in all_config.items()}
+        self.flush_task = asyncio.create_task(self.flush_stats_loop())
+        self.emoji_index_task = asyncio.create_task(self.build_emoji_index())
+
+    async def cog_unload(self):
+        if self.flush_task:
+            self.flush_task.cancel()
+        if self.emoji_index_task:
+            self.emoji_index_task.cancel()
+        self.dispatcher.close()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.test_executor.shutdown(wait=False, cancel_futures=True)
+        await self.flush_stats()
+
+    async def flush_stats_loop(self):
+        while True:
+            await asyncio.sleep(STATS_FLUSH_INTERVAL)
+            try:
+                await self.flush_stats()
+            except Exception:
+                log.exception("Failed to save autoreact stats")
+
+    async def flush_stats(self):
+        dirty, self.dirty_stats = self.dirty_stats, set()
+        for guild_id in dirty:
+            stats = self.pattern_stats.get(guild_id, {})
+            await self.config.guild_from_id(guild_id).pattern_stats.set({emoji: s.to_dict() for emoji, s in stats.items()})
+
+    async def get_matcher(self, guild: discord.Guild) -> PatternMatcher:
+        """Returns the guild's patterns, compiling them the first time they're needed."""
+        matcher = self.autoreacts.get(guild.id)
+        if matcher is not None:
+            self.autoreacts.move_to_end(guild.id)
+            return matcher
+        if guild.id in self.empty_guilds:
+            return self.empty_matcher
+        if guild.id not in self.loading_guilds:
+            self.loading_guilds[guild.id] = asyncio.create_task(self.load_guild(guild.id))
+        return await asyncio.shield(self.loading_guilds[guild.id])
+
+    async def load_guild(self, guild_id: int) -> PatternMatcher:
+        try:
+            conf = await self.config.guild_from_id(guild_id).all()
+            matcher = await asyncio.get_running_loop().run_in_executor(
+                self.executor, build_matcher, self.pattern_store, conf['autoreact_regexes'], conf['quarantined'])
+            if matcher.invalid:
+                log.warning(f"Skipped {len(matcher.invalid)} autoreacts in guild {guild_id} with invalid regexes: "
+                            f"{', '.join(matcher.invalid)}")
+            if guild_id not in self.coreact_chance:
+                self.set_coreact_chance(guild_id, conf['coreact_chance'])
+            if not matcher.patterns and not matcher.quarantined and not matcher.invalid:
+                self.empty_guilds.add(guild_id)
+                return self.empty_matcher
+            self.pattern_stats.setdefault(guild_id, {emoji: PatternStats.from_dict(data)
+                                                     for emoji, data in conf['pattern_stats'].items()})
+            self.autoreacts[guild_id] = matcher
+            evicted = []
+            while len(self.autoreacts) > MAX_RESIDENT_GUILDS:
+                evicted_id, evicted_matcher = self.autoreacts.popitem(last=False)
+                evicted_matcher.clear()
+                evicted.append(evicted_id)
+            await self.unload_stats(evicted)
+            await self.prune_dead_emojis([guild_id])
+            return matcher
+        finally:
+            del self.loading_guilds[guild_id]
+
+    async def unload_stats(self, guild_ids: Iterable[int]):
+        """Drops the stats of evicted guilds, saving the ones that changed."""
+        for guild_id in guild_ids:
+            stats = self.pattern_stats.pop(guild_id, None)
+            if guild_id in self.dirty_stats:
+                self.dirty_stats.discard(guild_id)
+                if stats is not None:
+                    await self.config.guild_from_id(guild_id).pattern_stats.set({emoji: s.to_dict() for emoji, s in stats.items()})
+
+    def set_coreact_chance(self, guild_id: int, chance: float):
+        self.coreact_chance[guild_id] = chance
+        self.coreact_chance.move_to_end(guild_id)
+        while len(self.coreact_chance) > MAX_RESIDENT_GUILDS:
+            self.coreact_chance.popitem(last=False)
+
+    async def build_emoji_index(self):
+        await self.bot.wait_until_red_ready()
+        self.usable_emojis = {emoji.id for emoji in self.bot.emojis}
+        self.emoji_index_ready = True
+        await self.prune_dead_emojis()
+
+    def is_usable_emoji(self, emoji: str) -> bool:
+        """Whether the bot can still react with an emoji. Assumes it can until the emoji index is built."""
+        if not self.emoji_index_ready or not emoji.startswith("<"):
+            return True
+        emoji_id = discord.PartialEmoji.from_str(emoji).id
+        return not emoji_id or emoji_id in self.usable_emojis
+
+    def can_prune_emojis(self) -> bool:
+        # emojis from servers that are temporarily unavailable aren't in the index
+        return self.emoji_index_ready and not any(guild.unavailable for guild in self.bot.guilds)
+
+    async def prune_dead_emojis(self, guild_ids: Optional[Iterable[int]] = None):
+        """Removes autoreacts whose custom emoji the bot can no longer use."""
+        if not self.can_prune_emojis():
+            return
+        for guild_id in [*(guild_ids or self.autoreacts)]:
+            matcher = self.autoreacts.get(guild_id)
+            if not matcher:
+                continue
+            for emoji in [*matcher.patterns, *matcher.quarantined, *matcher.invalid]:
+                if not self.is_usable_emoji(emoji) and await self.remove_autoreact(discord.Object(id=guild_id), emoji):
+                    log.info(f"Removed invalid or deleted emoji {emoji}")
+
+    def get_stats(self, guild_id: int, emoji: str) -> PatternStats:
+        if guild_id not in self.autoreacts:
+            return PatternStats()  # evicted while matching, its stats were already saved
+        self.dirty_stats.add(guild_id)
+        return self.pattern_stats.setdefault(guild_id, {}).setdefault(emoji, PatternStats())
 
     async def red_delete_data_for_user(self, requester: str, user_id: int):
-        pass
+        for guild_id, recent in self.recent_messages.items():
+            self.recent_messages[guild_id] = deque(((author_id, content) for author_id, content in recent
+                                                    if author_id != user_id), maxlen=RECENT_MESSAGES)
+
+    def remember_message(self, message: discord.Message):
+        if not message.content:
+            return
+        recent = self.recent_messages.get(message.guild.id)
+        if recent is None:
+            recent = self.recent_messages[message.guild.id] = deque(maxlen=RECENT_MESSAGES)
+            while len(self.recent_messages) > MAX_RESIDENT_GUILDS:
+                self.recent_messages.popitem(last=False)
+        else:
+            self.recent_messages.move_to_end(message.guild.id)
+        recent.append((message.author.id, message.content))
 
     # Listeners
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
+        await self.autoreact_message(message)
+
+    @commands.Cog.listener()
+    async def on_message_edit(self, before: discord.Message, after: discord.Message):
+        if before.content != after.content:
+            await self.autoreact_message(after, edited=True)
+
+    async def autoreact_message(self, message: discord.Message, edited: bool = False):
         if not message.guild or message.author.bot:
             return
         channel_perms = message.channel.permissions_for(message.guild.me)
         if not channel_perms.add_reactions:
             return
-        autoreact = self.autoreacts.get(message.guild.id, None)
-        if not autoreact:
-            return
+        autoreact = await self.get_matcher(message.guild)
         if not await self.is_valid_red_message(message):
             return
-        for emoji, regex in autoreact.items():
-            if not regex.search(message.content):
+        if not edited:
+            self.remember_message(message)
+        if not autoreact:
+            return
+        applied = self.applied_reactions.pop(message.id, None)
+        if applied is None:
+            applied = {str(reaction.emoji) for reaction in message.reactions if reaction.me} if edited else set()
+        self.applied_reactions[message.id] = applied
+        while len(self.applied_reactions) > TRACKED_MESSAGES:
+            self.applied_reactions.popitem(last=False)
+        async with self.match_slots:
+            result = await asyncio.get_running_loop().run_in_executor(
+                self.executor, autoreact.match, message.content, PATTERN_TIMEOUT, MESSAGE_BUDGET)
+        for emoji, elapsed in result.elapsed.items():
+            self.get_stats(message.guild.id, emoji).record(elapsed, emoji in result.matches)
+        for emoji in result.timeouts:
+            await self.strike_pattern(message.guild, emoji)
+        for emoji in result.matches:
+            if emoji in applied:
                 continue
-            try:
-                await message.add_reaction(emoji)
-            except Exception as error:
-                if "Unknown Emoji" in str(error):
-                    async with self.config.guild(message.guild).autoreact_regexes() as autoreacts:
-                        removed1 = autoreacts.pop(emoji, None)
-                        removed2 = self.autoreacts[message.guild.id].pop(emoji, None)
-                        if removed1 or removed2:
-                            log.info(f"Removed invalid or deleted emoji {emoji}")
-                            return
-                log.warning(f"Failed to react with {emoji} - {type(error).__name__}: {error}", exc_info=True)
-                    
+            if self.is_usable_emoji(emoji):
+                applied.add(emoji)
+                await self.dispatcher.react(message, emoji)
+            elif self.can_prune_emojis() and await self.remove_autoreact(message.guild, emoji):
+                log.info(f"Removed invalid or deleted emoji {emoji}")
+
     @commands.Cog.listener()
     async def on_reaction_add(self, reaction: discord.Reaction, user: discord.Member):
         message = reaction.message
@@ -74,20 +295,119 @@ class Autoreact(commands.Cog):
             return
         if any(existing.me for existing in message.reactions if existing.emoji == reaction.emoji):
             return
-        chance = self.coreact_chance.get(message.guild.id, 0.0)
+        chance = self.coreact_chance.get(message.guild.id)
+        if chance is None:
+            chance = await self.config.guild(message.guild).coreact_chance()
+        self.set_coreact_chance(message.guild.id, chance)
         if not chance or random() >= chance:
             return
         if not await self.is_valid_red_message(message):
             return
-        try:
-            await message.add_reaction(reaction.emoji)
-        except Exception as error:
-            log.warning(f"Failed to react with {reaction.emoji} - {type(error).__name__}: {error}", exc_info=True)
+        await self.dispatcher.react(message, reaction.emoji, wait=False)
+
+    @commands.Cog.listener()
+    async def on_guild_emojis_update(self, guild: discord.Guild, before: list[discord.Emoji], after: list[discord.Emoji]):
+        after_ids = {emoji.id for emoji in after}
+        self.usable_emojis.difference_update(emoji.id for emoji in before if emoji.id not in after_ids)
+        self.usable_emojis.update(after_ids)
+        if any(emoji.id not in after_ids for emoji in before):
+            await self.prune_dead_emojis()
+
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild: discord.Guild):
+        self.usable_emojis.update(emoji.id for emoji in guild.emojis)
+
+    @commands.Cog.listener()
+    async def on_guild_available(self, guild: discord.Guild):
+        self.usable_emojis.update(emoji.id for emoji in guild.emojis)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild):
+        self.usable_emojis.difference_update(emoji.id for emoji in guild.emojis)
+        self.empty_guilds.discard(guild.id)
+        await self.prune_dead_emojis()
+
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        self.dispatcher.mark_deleted(payload.channel_id, {payload.message_id})
+        self.applied_reactions.pop(payload.message_id, None)
+
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(self, payload: discord.RawBulkMessageDeleteEvent):
+        self.dispatcher.mark_deleted(payload.channel_id, payload.message_ids)
+        for message_id in payload.message_ids:
+            self.applied_reactions.pop(message_id, None)
+
+    async def on_reaction_error(self, message: discord.Message, emoji: Emoji, error: Exception):
+        is_autoreact = message.guild and str(emoji) in self.autoreacts.get(message.guild.id, {})
+        if is_autoreact:
+            self.get_stats(message.guild.id, str(emoji)).failed_reactions += 1
+        if "Unknown Emoji" in str(error) and is_autoreact:
+            if await self.remove_autoreact(message.guild, str(emoji)):
+                log.info(f"Removed invalid or deleted emoji {emoji}")
+                return
+        log.warning(f"Failed to react with {emoji} - {type(error).__name__}: {error}", exc_info=True)
+
+    async def strike_pattern(self, guild: discord.Guild, emoji: str):
+        stats = self.get_stats(guild.id, emoji)
+        stats.timeouts += 1
+        if stats.timeouts < QUARANTINE_STRIKES:
+            return
+        if guild.id in self.autoreacts:
+            self.autoreacts[guild.id].quarantine(emoji)
+        async with self.config.guild(guild).quarantined() as quarantined:
+            if emoji not in quarantined:
+                quarantined.append(emoji)
+        log.warning(f"Quarantined autoreact {emoji} in guild {guild.id} after {stats.timeouts} timeouts, "
+                    f"{stats.total_time:.2f}s spent matching it")
+
+    async def forget_patterns(self, guild: discord.Guild, emojis: Iterable[str]):
+        emojis = set(emojis)
+        guild_stats = self.pattern_stats.get(guild.id, {})
+        if any([guild_stats.pop(emoji, None) for emoji in emojis]):
+            self.dirty_stats.add(guild.id)
+        quarantined = await self.config.guild(guild).quarantined()
+        if any(emoji in emojis for emoji in quarantined):
+            await self.config.guild(guild).quarantined.set([emoji for emoji in quarantined if emoji not in emojis])
+
+    async def remove_autoreact(self, guild: discord.Guild, emoji: str) -> bool:
+        await self.forget_patterns(guild, [emoji])
+        async with self.config.guild(guild).autoreact_regexes() as autoreacts:
+            removed1 = autoreacts.pop(emoji, None)
+            removed2 = self.autoreacts[guild.id].remove(emoji) if guild.id in self.autoreacts else None
+            return bool(removed1 or removed2)
+
+    async def apply_patterns(self, guild: discord.Guild, compiled: dict[str, regex.Pattern]):
+        """Adds patterns that were just saved to the guild's matcher.
+        A matcher evicted while waiting has already been cleared, and the next load reads the saved patterns instead."""
+        self.empty_guilds.discard(guild.id)
+        matcher = await self.get_matcher(guild)
+        if matcher is self.empty_matcher:  # a load that read the config before the patterns were saved
+            self.empty_guilds.discard(guild.id)
+            matcher = await self.get_matcher(guild)
+        if self.autoreacts.get(guild.id) is matcher:
+            matcher.update({emoji: pattern.pattern for emoji, pattern in compiled.items()}, compiled)
+
+    @commands.Cog.listener()
+    async def on_command_completion(self, ctx: commands.Context):
+        name = ctx.command.qualified_name
+        if name.split(" ")[0] in PERMISSION_COMMANDS or name.startswith(COG_TOGGLE_COMMANDS):
+            self.valid_message_cache.clear()
 
     async def is_valid_red_message(self, message: discord.Message) -> bool:
-        return await self.bot.allowed_by_whitelist_blacklist(message.author) \
-               and await self.bot.ignored_channel_or_guild(message) \
-               and not await self.bot.cog_disabled_in_guild(self, message.guild)
+        key = (message.author.id, message.channel.id, message.guild.id)
+        cached = self.valid_message_cache.pop(key, None)
+        now = monotonic()
+        if cached and cached[1] > now:
+            self.valid_message_cache[key] = cached
+            return cached[0]
+        valid = await self.bot.allowed_by_whitelist_blacklist(message.author) \
+                and await self.bot.ignored_channel_or_guild(message) \
+                and not await self.bot.cog_disabled_in_guild(self, message.guild)
+        self.valid_message_cache[key] = (valid, now + VALID_MESSAGE_TTL)
+        while len(self.valid_message_cache) > VALID_MESSAGE_CACHE_SIZE:
+            del self.valid_message_cache[next(iter(self.valid_message_cache))]
+        return valid
 
     # Commands
 
@@ -108,22 +428,22 @@ class Autoreact(commands.Cog):
         if isinstance(emoji, discord.Emoji) and emoji not in self.bot.emojis:
             await ctx.send("I must be in the same guild as an emoji to be able to use it!")
             return
-        if len(pattern) > 400:
-            await ctx.send("Sorry, the regex may not be longer than 400 characters.")
+        if len(pattern) > MAX_PATTERN_LENGTH:
+            await ctx.send(f"Sorry, the regex may not be longer than {MAX_PATTERN_LENGTH} characters.")
             return
         if pattern.startswith('`') and pattern.endswith('`'):
             pattern = pattern.strip('`')
         try:
-            pattern = re.compile(pattern)
+            pattern = regex.compile(pattern)
         except Exception as error:
             await ctx.send(f"Invalid regex pattern: {error}")
             return
         emoji = str(emoji)
-        self.autoreacts.setdefault(ctx.guild.id, {})
+        await self.forget_patterns(ctx.guild, [emoji])
         async with self.config.guild(ctx.guild).autoreact_regexes() as autoreacts:
             autoreacts[emoji] = pattern.pattern
-            self.autoreacts[ctx.guild.id][emoji] = pattern
-            await ctx.react_quietly("✅")
+        await self.apply_patterns(ctx.guild, {emoji: pattern})
+        await ctx.react_quietly("✅")
 
     @autoreact.command()
     @commands.has_permissions(manage_guild=True)
@@ -133,23 +453,116 @@ class Autoreact(commands.Cog):
             await ctx.send("Sorry, that doesn't seem to be a valid emoji. "
                            "If the emoji was deleted, trigger the autoreact to remove it automatically.")
             return
-        emoji = str(emoji)
-        self.autoreacts.setdefault(ctx.guild.id, {})
-        async with self.config.guild(ctx.guild).autoreact_regexes() as autoreacts:
-            removed1 = autoreacts.pop(emoji, None)
-            removed2 = self.autoreacts[ctx.guild.id].pop(emoji, None)
-            if removed1 or removed2:
-                await ctx.react_quietly("✅")
+        await self.get_matcher(ctx.guild)
+        if await self.remove_autoreact(ctx.guild, str(emoji)):
+            await ctx.react_quietly("✅")
+        else:
+            await ctx.send("No autoreacts found for that emoji.")
+
+    @autoreact.command(name="import")
+    @commands.has_permissions(manage_guild=True)
+    @commands.bot_has_permissions(add_reactions=True)
+    async def import_(self, ctx: commands.Context):
+        """Add many autoreacts at once from an attached file.
+
+        The file can be a JSON object of emojis to patterns, like the one from `[p]autoreact export`,
+        or a text file with an emoji followed by a pattern on each line.
+        Nothing is added if any of the entries are invalid."""
+        if not ctx.message.attachments:
+            return await ctx.send("Please attach a JSON or text file with the autoreacts to import.")
+        attachment = ctx.message.attachments[0]
+        if attachment.size > MAX_IMPORT_SIZE:
+            return await ctx.send("Sorry, that file is too big.")
+        try:
+            entries = parse_autoreacts((await attachment.read()).decode("utf-8"))
+        except UnicodeDecodeError:
+            return await ctx.send("Sorry, that file doesn't seem to contain text.")
+        if not entries:
+            return await ctx.send("No autoreacts found in that file.")
+        errors, valid = [], []
+        for emoji, pattern in entries:
+            partial = discord.PartialEmoji.from_str(emoji)
+            if partial.id:
+                custom = self.bot.get_emoji(partial.id)
+                if not custom:
+                    errors.append(f"{emoji} is a custom emoji from a server I'm not in")
+                    continue
+                emoji = str(custom)
+            elif not is_emoji(emoji) and not is_regional_indicator(emoji):
+                errors.append(f"`{emoji}` is not a valid emoji")
+                continue
+            if not pattern:
+                errors.append(f"{emoji} has no regex pattern")
+            elif len(pattern) > MAX_PATTERN_LENGTH:
+                errors.append(f"{emoji} regex is longer than {MAX_PATTERN_LENGTH} characters")
             else:
-                await ctx.send("No autoreacts found for that emoji.")
+                valid.append((emoji, pattern))
+        compiled, compile_errors = await asyncio.get_running_loop().run_in_executor(self.executor, compile_patterns, valid)
+        errors += compile_errors
+        if errors:
+            shown = '\n'.join(errors[:10]) + (f"\n...and {len(errors) - 10} more" if len(errors) > 10 else "")
+            return await ctx.send(f"Nothing was imported, please fix these entries:\n{shown}")
+        await self.forget_patterns(ctx.guild, compiled)
+        async with self.config.guild(ctx.guild).autoreact_regexes() as autoreacts:
+            autoreacts.update({emoji: pattern.pattern for emoji, pattern in compiled.items()})
+        await self.apply_patterns(ctx.guild, compiled)
+        await ctx.send(f"✅ Imported {len(compiled)} autoreacts.")
+
+    @autoreact.command()
+    @commands.has_permissions(manage_guild=True)
+    @commands.bot_has_permissions(attach_files=True)
+    async def export(self, ctx: commands.Context):
+        """Sends all of this server's autoreacts as a JSON file, which can be used with `[p]autoreact import`."""
+        autoreacts = await self.config.guild(ctx.guild).autoreact_regexes()
+        if not autoreacts:
+            return await ctx.send("None.")
+        data = json.dumps(autoreacts, indent=2, ensure_ascii=False).encode("utf-8")
+        await ctx.send(file=discord.File(io.BytesIO(data), filename=f"autoreacts-{ctx.guild.id}.json"))
+
+    @autoreact.command()
+    @commands.has_permissions(manage_guild=True)
+    async def test(self, ctx: commands.Context, *, pattern: str):
+        """Tries a regex on recent messages without reacting, showing how often it matches and how slow it is."""
+        if len(pattern) > MAX_PATTERN_LENGTH:
+            return await ctx.send(f"Sorry, the regex may not be longer than {MAX_PATTERN_LENGTH} characters.")
+        if pattern.startswith('`') and pattern.endswith('`'):
+            pattern = pattern.strip('`')
+        try:
+            compiled = regex.compile(pattern)
+        except Exception as error:
+            return await ctx.send(f"Invalid regex pattern: {error}")
+        texts = [content for _, content in self.recent_messages.get(ctx.guild.id, ())]
+        if not texts:
+            return await ctx.send("I haven't seen any messages in this server recently, try again later.")
+        result = await asyncio.get_running_loop().run_in_executor(
+            self.test_executor, shadow_evaluate, compiled, texts, PATTERN_TIMEOUT, QUARANTINE_STRIKES, TEST_BUDGET)
+        match_rate = result.matches / result.evaluated
+        lines = [f"Matched **{result.matches}** of the last {result.evaluated} messages ({match_rate * 100:.1f}%)",
+                 f"Average time {result.total_time / result.evaluated * 1e6:.0f}µs, worst {result.worst_time * 1000:.2f}ms"]
+        if result.timeouts:
+            lines.append(f"⚠️ Timed out on {result.timeouts} messages, this pattern would get quarantined.")
+        elif result.evaluated < len(texts):
+            lines.append(f"⚠️ Stopped after {result.evaluated} of {len(texts)} messages, this pattern is too slow.")
+        elif result.worst_time > PATTERN_TIMEOUT / 2:
+            lines.append("⚠️ This pattern is close to the time limit and may get quarantined.")
+        if match_rate > 0.2:
+            lines.append("⚠️ This pattern would react to a lot of messages.")
+        await ctx.send('\n'.join(lines))
 
     @autoreact.command()
     async def list(self, ctx: commands.Context):
         """Shows all autoreacts."""
-        if ctx.guild.id not in self.autoreacts or not self.autoreacts[ctx.guild.id]:
+        matcher = await self.get_matcher(ctx.guild)
+        if not matcher.patterns and not matcher.quarantined and not matcher.invalid:
             return await ctx.send("None.")
-        autoreacts = [f"{emoji} {regex.pattern if '`' in regex.pattern else f'`{regex.pattern}`'}"
-                      for emoji, regex in self.autoreacts[ctx.guild.id].items()]
+        autoreacts = [f"{emoji} {pattern.pattern if '`' in pattern.pattern else f'`{pattern.pattern}`'}"
+                      for emoji, pattern in matcher.items()]
+        autoreacts += [f"{emoji} {pattern.pattern if '`' in pattern.pattern else f'`{pattern.pattern}`'} "
+                       f"⚠️ *quarantined for being too slow, add it again to retry*"
+                       for emoji, pattern in matcher.quarantined.items()]
+        autoreacts += [f"{emoji} {text if '`' in text else f'`{text}`'} "
+                       f"⚠️ *invalid regex, add it again with a fixed pattern*"
+                       for emoji, text in matcher.invalid.items()]
         pages = []
         for i, batch in enumerate(batched(autoreacts, 10)):
             embed = discord.Embed(title="Server Autoreacts", color=await ctx.embed_color())
@@ -161,7 +574,43 @@ class Autoreact(commands.Cog):
             await ctx.send(embed=pages[0])
         else:
             await SimpleMenu(pages, timeout=600).start(ctx)
-        
+
+    @autoreact.command()
+    @commands.has_permissions(manage_guild=True)
+    async def stats(self, ctx: commands.Context):
+        """Shows how often each autoreact is checked and matched, and how much time it costs, most expensive first."""
+        matcher = await self.get_matcher(ctx.guild)
+        if not matcher.patterns and not matcher.quarantined:
+            return await ctx.send("None.")
+        guild_stats = self.pattern_stats.get(ctx.guild.id, {})
+        emojis = sorted([*matcher.patterns, *matcher.quarantined],
+                        key=lambda e: guild_stats[e].total_time if e in guild_stats else 0.0, reverse=True)
+        entries = []
+        for emoji in emojis:
+            stats = guild_stats.get(emoji, PatternStats())
+            entry = f"{emoji} **{stats.total_time * 1000:.1f}ms** total, {stats.average_time * 1e6:.0f}µs avg, " \
+                    f"{stats.evaluations} checks, {stats.matches} matches"
+            if stats.evaluations and not stats.matches:
+                entry += " (never matched)"
+            if stats.timeouts or stats.failed_reactions:
+                entry += f", {stats.timeouts} timeouts, {stats.failed_reactions} failed reactions"
+            if emoji in matcher.quarantined:
+                entry += " ⚠️ *quarantined*"
+            if stats.evaluations:
+                entry += "\n└ " + " · ".join(f"{bucket_label(i)} {count}" for i, count in enumerate(stats.histogram))
+            entries.append(entry)
+        pages = []
+        for i, batch in enumerate(batched(entries, 10)):
+            embed = discord.Embed(title="Autoreact Stats", color=await ctx.embed_color())
+            if len(entries) > 10:
+                embed.set_footer(text=f"Page {i+1}/{(9+len(entries))//10}")
+            embed.description = '\n'.join(batch)
+            pages.append(embed)
+        if len(pages) == 1:
+            await ctx.send(embed=pages[0])
+        else:
+            await SimpleMenu(pages, timeout=600).start(ctx)
+
     @commands.group(invoke_without_command=True)
     @commands.has_permissions(manage_guild=True)
     async def coreact(self, ctx: commands.Context):
@@ -172,8 +621,9 @@ class Autoreact(commands.Cog):
     async def chance(self, ctx: commands.Context, chance: Optional[float]):
         """The percent chance that the bot will add its own reaction when anyone else reacts."""
         if chance is None:
-            return await ctx.send(f"The current chance is {self.coreact_chance.get(ctx.guild.id, 0.0) * 100:.2f}%")
+            chance = await self.config.guild(ctx.guild).coreact_chance()
+            return await ctx.send(f"The current chance is {chance * 100:.2f}%")
         chance = max(0.0, min(100.0, chance)) / 100
         await self.config.guild(ctx.guild).coreact_chance.set(chance)
-        self.coreact_chance[ctx.guild.id] = chance
+        self.set_coreact_chance(ctx.guild.id, chance)
         await ctx.send(f"✅ The new chance is {chance * 100:.2f}%")
@@ -0,0 +1,74 @@
+import asyncio
+import discord
+from typing import Awaitable, Callable, Optional, Union
+
+REACTION_INTERVAL = 0.25  # discord allows about one reaction per quarter second in a channel
+REACTION_QUEUE_SIZE = 20
+UNKNOWN_MESSAGE = 10008
+
+Emoji = Union[discord.Emoji, discord.PartialEmoji, discord.Reaction, str]
+
+
+class ChannelReactions:
+    def __init__(self):
+        self.queue: asyncio.Queue[tuple[discord.Message, Emoji]] = asyncio.Queue(REACTION_QUEUE_SIZE)
+        self.pending: set[tuple[int, str]] = set()
+        self.deleted: set[int] = set()
+        self.task: Optional[asyncio.Task] = None
+
+
+class ReactionDispatcher:
+    """Queues reactions per channel and sends them one at a time, paced to the channel's reaction rate limit.
+    Duplicate reactions to the same message are dropped, as is pending work for messages that got deleted."""
+
+    def __init__(self, on_error: Callable[[discord.Message, Emoji, Exception], Awaitable[None]]):
+        self.on_error = on_error
+        self.channels: dict[int, ChannelReactions] = {}
+
+    async def react(self, message: discord.Message, emoji: Emoji, wait: bool = True) -> bool:
+        """Queues a reaction. If the channel's queue is full, waits for room, or gives up if wait is False.
+        Returns whether the reaction was queued."""
+        channel = self.channels.setdefault(message.channel.id, ChannelReactions())
+        key = (message.id, str(emoji))
+        if key in channel.pending or message.id in channel.deleted:
+            return False
+        if not wait and channel.queue.full():
+            return False
+        channel.pending.add(key)
+        try:
+            await channel.queue.put((message, emoji))
+        except asyncio.CancelledError:
+            channel.pending.discard(key)
+            raise
+        if not channel.task or channel.task.done():
+            channel.task = asyncio.create_task(self._run(message.channel.id, channel))
+        return True
+
+    def mark_deleted(self, channel_id: int, message_ids: set[int]):
+        channel = self.channels.get(channel_id)
+        if channel:
+            channel.deleted.update(message_ids)
+
+    def close(self):
+        for channel in self.channels.values():
+            if channel.task:
+                channel.task.cancel()
+        self.channels.clear()
+
+    async def _run(self, channel_id: int, channel: ChannelReactions):
+        while not channel.queue.empty():
+            message, emoji = channel.queue.get_nowait()
+            channel.pending.discard((message.id, str(emoji)))
+            if message.id in channel.deleted:
+                continue
+            try:
+                await message.add_reaction(emoji)
+            except discord.NotFound as error:
+                if error.code != UNKNOWN_MESSAGE:
+                    await self.on_error(message, emoji, error)
+                channel.deleted.add(message.id)
+            except Exception as error:
+                await self.on_error(message, emoji, error)
+            await asyncio.sleep(REACTION_INTERVAL)
+        if self.channels.get(channel_id) is channel:
+            del self.channels[channel_id]
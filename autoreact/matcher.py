@@ -0,0 +1,290 @@
+import re
+import regex
+import string
+import threading
+from collections import deque
+from time import perf_counter
+from typing import Iterable, NamedTuple, Optional
+
+try:
+    from re import _parser as sre_parse  # python 3.11+
+except ImportError:
+    import sre_parse
+
+_LITERAL = sre_parse.LITERAL
+_SUBPATTERN = sre_parse.SUBPATTERN
+# Characters whose case-insensitive matches are exactly the ones found by str.lower(),
+# "i", "k" and "s" are excluded as they also match characters like "İ", "K" and "ſ"
+_CASELESS_SAFE = frozenset(c for c in string.printable if c.lower() not in "iks" and c.isprintable())
+_ESCAPE = re.compile(r"\\.", re.DOTALL)
+_REPEAT = re.compile(r"\{(?:\d+(?:,\d*)?|,\d+)\}")
+
+
+def _regex_only_syntax(pattern: str) -> bool:
+    """Whether the pattern has syntax that sre reads as literal text but the regex package doesn't,
+    like fuzzy matching "(?:hello){e<=1}" or POSIX classes "[[:alpha:]]"."""
+    bare = _REPEAT.sub("", _ESCAPE.sub("", pattern))
+    return "{" in bare or "}" in bare or "[:" in bare
+
+
+def required_literal(pattern: str) -> Optional[str]:
+    """Finds the longest literal substring that any match of the pattern must contain.
+    Literals of case-insensitive patterns are returned lowercased. Returns None if there is no such literal,
+    or if the pattern uses syntax only the regex package understands."""
+    if _regex_only_syntax(pattern):
+        return None
+    try:
+        parsed = sre_parse.parse(pattern)
+    except Exception:
+        return None
+    ignorecase = bool(parsed.state.flags & re.IGNORECASE)
+    best = ""
+    sequences = deque([parsed])
+    while sequences:
+        run = []
+        for op, arg in sequences.popleft():
+            if op is _LITERAL and (not ignorecase or chr(arg) in _CASELESS_SAFE):
+                run.append(chr(arg))
+                continue
+            if len(run) > len(best):
+                best = "".join(run)
+            run = []
+            if op is _SUBPATTERN and not arg[1] and not arg[2]:  # plain group without local flags
+                sequences.append(arg[3])
+        if len(run) > len(best):
+            best = "".join(run)
+    if not best:
+        return None
+    return best.lower() if ignorecase else best
+
+
+class AhoCorasick:
+    """Finds which of a set of keywords appear in a text in a single pass."""
+
+    def __init__(self, keywords: Iterable[str]):
+        self.goto: list[dict[str, int]] = [{}]
+        self.output: list[set[str]] = [set()]
+        for keyword in keywords:
+            state = 0
+            for char in keyword:
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.output.append(set())
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.output[state].add(keyword)
+        self.fail = [0] * len(self.goto)
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.output[child] |= self.output[self.fail[child]]
+
+    def search(self, text: str) -> set[str]:
+        goto, fail, output = self.goto, self.fail, self.output
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found |= output[state]
+        return found
+
+
+class ShadowResult(NamedTuple):
+    evaluated: int
+    matches: int
+    timeouts: int
+    total_time: float
+    worst_time: float
+
+
+def shadow_evaluate(pattern: regex.Pattern, texts: Iterable[str], timeout: float,
+                    max_timeouts: int, budget: float) -> ShadowResult:
+    """Times a pattern against many texts without reacting to anything.
+    Stops early after max_timeouts timeouts, or once budget seconds have been spent in total."""
+    evaluated = matches = timeouts = 0
+    total_time = worst_time = 0.0
+    for text in texts:
+        if timeouts >= max_timeouts or total_time >= budget:
+            break
+        limit = min(timeout, budget - total_time)
+        start = perf_counter()
+        try:
+            matches += bool(pattern.search(text, timeout=limit, concurrent=True))
+        except TimeoutError:
+            timeouts += limit == timeout
+        elapsed = perf_counter() - start
+        evaluated += 1
+        total_time += elapsed
+        worst_time = max(worst_time, elapsed)
+    return ShadowResult(evaluated, matches, timeouts, total_time, worst_time)
+
+
+class MatchResult(NamedTuple):
+    matches: list[str]
+    timeouts: list[str]
+    elapsed: dict[str, float]
+
+
+class PatternStore:
+    """Shares one compiled regex between every guild that uses the same pattern text, counting references.
+    Matchers are built in worker threads, so access is locked."""
+
+    def __init__(self):
+        self.patterns: dict[str, regex.Pattern] = {}
+        self.references: dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def acquire(self, text: str, compiled: Optional[regex.Pattern] = None) -> regex.Pattern:
+        """Returns the shared regex for a pattern, compiling it if no guild uses it yet."""
+        with self.lock:
+            pattern = self.patterns.get(text)
+            if pattern is None:
+                pattern = self.patterns[text] = compiled or regex.compile(text)
+            self.references[text] = self.references.get(text, 0) + 1
+            return pattern
+
+    def release(self, text: str):
+        with self.lock:
+            references = self.references.get(text, 0) - 1
+            if references > 0:
+                self.references[text] = references
+            else:
+                self.references.pop(text, None)
+                self.patterns.pop(text, None)
+
+
+class PatternMatcher:
+    """Matches a message against all of a guild's autoreact patterns at once.
+    A regex only runs if the literal text it requires is present in the message, found in one Aho-Corasick pass.
+    Matching happens in worker threads, so the pattern dicts are replaced rather than mutated."""
+
+    def __init__(self, store: PatternStore):
+        self.store = store
+        self.patterns: dict[str, regex.Pattern] = {}
+        self.quarantined: dict[str, regex.Pattern] = {}
+        self.invalid: dict[str, str] = {}  # emoji -> pattern text that failed to compile
+        self.literals: dict[str, tuple[str, bool]] = {}
+        self._automaton: Optional[AhoCorasick] = None
+        self._caseless_automaton: Optional[AhoCorasick] = None
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def __bool__(self):
+        return bool(self.patterns)
+
+    def __contains__(self, emoji: str):
+        return emoji in self.patterns or emoji in self.quarantined or emoji in self.invalid
+
+    def items(self):
+        return self.patterns.items()
+
+    def add(self, emoji: str, text: str, compiled: Optional[regex.Pattern] = None):
+        self.update({emoji: text}, {emoji: compiled} if compiled else None)
+
+    def update(self, patterns: dict[str, str], compiled: Optional[dict[str, regex.Pattern]] = None) -> dict[str, str]:
+        """Adds or replaces many patterns, rebuilding the prefilter only once.
+        Already compiled regexes may be passed in to avoid compiling them again.
+        Patterns that fail to compile are kept aside in invalid and returned, so the rest still work."""
+        compiled = compiled or {}
+        acquired, failed = {}, {}
+        for emoji, text in patterns.items():
+            try:
+                acquired[emoji] = self.store.acquire(text, compiled.get(emoji))
+            except Exception:
+                failed[emoji] = text
+        replaced = [p.pattern for e, p in (*self.patterns.items(), *self.quarantined.items()) if e in patterns]
+        literals = dict(self.literals)
+        for emoji, pattern in acquired.items():
+            literal = required_literal(pattern.pattern)
+            if literal:
+                literals[emoji] = (literal, bool(pattern.flags & regex.IGNORECASE))
+            else:
+                literals.pop(emoji, None)
+        for emoji in failed:
+            literals.pop(emoji, None)
+        self.quarantined = {emoji: pattern for emoji, pattern in self.quarantined.items() if emoji not in patterns}
+        self.patterns = {**{e: p for e, p in self.patterns.items() if e not in failed}, **acquired}
+        self.invalid = {**{e: t for e, t in self.invalid.items() if e not in patterns}, **failed}
+        self._rebuild(literals)
+        for text in replaced:
+            self.store.release(text)
+        return failed
+
+    def remove(self, emoji: str) -> Optional[regex.Pattern]:
+        self.invalid = {e: t for e, t in self.invalid.items() if e != emoji}
+        pattern = self._detach(emoji)
+        if pattern is not None:
+            self.store.release(pattern.pattern)
+        return pattern
+
+    def quarantine(self, emoji: str):
+        """Stops evaluating a pattern while keeping it listed."""
+        pattern = self._detach(emoji)
+        if pattern is not None:
+            self.quarantined = {**self.quarantined, emoji: pattern}
+
+    def clear(self):
+        """Removes every pattern, releasing them from the store."""
+        for pattern in (*self.patterns.values(), *self.quarantined.values()):
+            self.store.release(pattern.pattern)
+        self.patterns, self.quarantined, self.invalid = {}, {}, {}
+        self._rebuild({})
+
+    def _detach(self, emoji: str) -> Optional[regex.Pattern]:
+        pattern = self.patterns.get(emoji) or self.quarantined.get(emoji)
+        if pattern is None:
+            return None
+        self.quarantined = {e: p for e, p in self.quarantined.items() if e != emoji}
+        self.patterns = {e: p for e, p in self.patterns.items() if e != emoji}
+        if emoji in self.literals:
+            self._rebuild({e: lit for e, lit in self.literals.items() if e != emoji})
+        return pattern
+
+    def _rebuild(self, literals: dict[str, tuple[str, bool]]):
+        self._automaton = AhoCorasick(lit for lit, caseless in literals.values() if not caseless)
+        self._caseless_automaton = AhoCorasick(lit for lit, caseless in literals.values() if caseless)
+        self.literals = literals
+
+    def match(self, text: str, pattern_timeout: float, message_budget: float) -> MatchResult:
+        """Returns every emoji whose pattern matches the text, in insertion order.
+        Each pattern may run for pattern_timeout seconds, and evaluation stops once message_budget is spent.
+        Patterns that ran out of their own full timeout are reported in timeouts."""
+        patterns, literals = self.patterns, self.literals
+        automaton, caseless_automaton = self._automaton, self._caseless_automaton
+        found = automaton.search(text) if automaton else set()
+        caseless_found = caseless_automaton.search(text.lower()) if caseless_automaton else set()
+        result = MatchResult([], [], {})
+        deadline = perf_counter() + message_budget
+        for emoji, pattern in patterns.items():
+            literal = literals.get(emoji)
+            if literal and literal[0] not in (caseless_found if literal[1] else found):
+                continue
+            start = perf_counter()
+            remaining = deadline - start
+            if remaining <= 0:
+                break
+            timeout = min(pattern_timeout, remaining)
+            try:
+                matched = pattern.search(text, timeout=timeout, concurrent=True)
+            except TimeoutError:
+                result.elapsed[emoji] = perf_counter() - start
+                if timeout == pattern_timeout:
+                    result.timeouts.append(emoji)
+                continue
+            result.elapsed[emoji] = perf_counter() - start
+            if matched:
+                result.matches.append(emoji)
+        return result
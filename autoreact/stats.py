@@ -0,0 +1,44 @@
+from dataclasses import dataclass, field, asdict
+
+LATENCY_BUCKETS = (0.0001, 0.001, 0.01, 0.05)  # seconds, with one more bucket for anything slower
+
+
+def bucket_label(i: int) -> str:
+    if i < len(LATENCY_BUCKETS):
+        return f"≤{LATENCY_BUCKETS[i] * 1000:g}ms"
+    return f">{LATENCY_BUCKETS[-1] * 1000:g}ms"
+
+
+@dataclass
+class PatternStats:
+    evaluations: int = 0
+    matches: int = 0
+    total_time: float = 0.0
+    timeouts: int = 0
+    failed_reactions: int = 0
+    histogram: list[int] = field(default_factory=lambda: [0] * (len(LATENCY_BUCKETS) + 1))
+
+    @property
+    def average_time(self) -> float:
+        return self.total_time / self.evaluations if self.evaluations else 0.0
+
+    def record(self, elapsed: float, matched: bool):
+        self.evaluations += 1
+        self.matches += matched
+        self.total_time += elapsed
+        for i, limit in enumerate(LATENCY_BUCKETS):
+            if elapsed <= limit:
+                self.histogram[i] += 1
+                break
+        else:
+            self.histogram[-1] += 1
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "PatternStats":
+        stats = cls(**{key: value for key, value in data.items() if key != "histogram"})
+        if len(data.get("histogram", ())) == len(stats.histogram):
+            stats.histogram = list(data["histogram"])
+        return stats
@@ -0,0 +1,143 @@
+"""
+Offline throughput benchmark for the autoreact cog.
+
+Drives Autoreact.on_message and Autoreact.on_reaction_add with fake discord objects and a stub Red bot,
+so changes to the matching path can be compared locally without connecting to Discord.
+Message texts and pattern sets are generated from a seed, or messages can be replayed from a file.
+
+Run from the repository root with the cog's requirements installed:
+    python -m benchmarks.autoreact_benchmark --messages 5000 --sizes 10 100 1000
+"""
+import argparse
+import asyncio
+import random
+import tempfile
+from pathlib import Path
+from statistics import quantiles
+from time import perf_counter
+from types import SimpleNamespace
+from typing import Optional
+
+from redbot.core import data_manager
+
+import autoreact.dispatcher
+from autoreact.autoreact import Autoreact
+
+WORDS = ["good", "morning", "night", "cat", "dog", "pizza", "lol", "based", "cringe", "hello", "bye", "coffee",
+         "tea", "game", "win", "lose", "meme", "bot", "why", "yes", "no", "maybe", "love", "hate", "friday"]
+PATTERN_TEMPLATES = [r"(?i)\b{0}\b", r"{0}|{1}", r"(?i){0}\s+{1}", r"\b{0}\d*\b", r"(?i)^{0}", r"{0}.*{1}", r"(?:{0}){{2,}}"]
+GUILD_ID = 1
+CHANNEL_ID = 2
+BOT_ID = 3
+EMOJI_ID_START = 10**17
+
+
+class StubBot:
+    """Implements just enough of Red for the autoreact cog."""
+
+    def __init__(self, emoji_ids: list[int]):
+        self.emojis = [SimpleNamespace(id=emoji_id) for emoji_id in emoji_ids]
+        self.guilds = []
+        self.user = SimpleNamespace(id=BOT_ID)
+
+    async def wait_until_red_ready(self):
+        pass
+
+    async def allowed_by_whitelist_blacklist(self, who) -> bool:
+        return True
+
+    async def ignored_channel_or_guild(self, ctx) -> bool:
+        return True
+
+    async def cog_disabled_in_guild(self, cog, guild) -> bool:
+        return False
+
+
+class FakeMessage:
+    def __init__(self, message_id: int, content: str, guild, channel, author):
+        self.id = message_id
+        self.content = content
+        self.guild = guild
+        self.channel = channel
+        self.author = author
+        self.reactions = []
+        self.reaction_calls = 0
+
+    async def add_reaction(self, emoji):
+        self.reaction_calls += 1
+
+
+def make_corpus(rng: random.Random, count: int, corpus_file: Optional[Path]) -> list[str]:
+    if corpus_file:
+        lines = [line for line in corpus_file.read_text(encoding="utf-8").splitlines() if line.strip()]
+        return [lines[i % len(lines)] for i in range(count)]
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 30))) for _ in range(count)]
+
+
+def make_patterns(rng: random.Random, count: int) -> dict[str, str]:
+    return {f"<:e{i}:{EMOJI_ID_START + i}>": rng.choice(PATTERN_TEMPLATES).format(rng.choice(WORDS), rng.choice(WORDS))
+            for i in range(count)}
+
+
+def report(name: str, latencies: list[float]):
+    total = sum(latencies)
+    percentiles = quantiles(latencies, n=100)
+    print(f"{name:<32} {len(latencies) / total:>10.0f} msg/s   "
+          f"p50 {percentiles[49] * 1e6:>8.1f}µs   p99 {percentiles[98] * 1e6:>8.1f}µs")
+
+
+async def bench_size(size: int, corpus: list[str], seed: int):
+    bot = StubBot([EMOJI_ID_START + i for i in range(size)])
+    cog = Autoreact(bot)
+    await cog.config.clear_all_guilds()
+    await cog.config.guild_from_id(GUILD_ID).autoreact_regexes.set(make_patterns(random.Random(seed), size))
+    await cog.config.guild_from_id(GUILD_ID).coreact_chance.set(1.0)
+    await cog.cog_load()
+
+    me = SimpleNamespace(id=BOT_ID)
+    guild = SimpleNamespace(id=GUILD_ID, me=me)
+    perms = SimpleNamespace(add_reactions=True)
+    channel = SimpleNamespace(id=CHANNEL_ID, permissions_for=lambda member: perms)
+    author = SimpleNamespace(id=4, bot=False)
+    messages = [FakeMessage(i, text, guild, channel, author) for i, text in enumerate(corpus)]
+
+    latencies = []
+    for message in messages:
+        start = perf_counter()
+        await cog.on_message(message)
+        latencies.append(perf_counter() - start)
+    report(f"on_message ({size} patterns)", latencies)
+
+    latencies = []
+    for message in messages:
+        reaction = SimpleNamespace(message=message, emoji="👍")
+        start = perf_counter()
+        await cog.on_reaction_add(reaction, author)
+        latencies.append(perf_counter() - start)
+    report(f"on_reaction_add ({size} patterns)", latencies)
+
+    while cog.dispatcher.channels:
+        await asyncio.sleep(0.01)
+    reactions = sum(message.reaction_calls for message in messages)
+    print(f"{'':<32} {reactions} reactions sent for {len(messages)} messages")
+    await cog.cog_unload()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=2000, help="number of messages per run")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000], help="pattern set sizes")
+    parser.add_argument("--corpus", type=Path, help="file with one message per line to replay")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    autoreact.dispatcher.REACTION_INTERVAL = 0  # measure the cog, not discord's rate limit
+    with tempfile.TemporaryDirectory() as data_path:
+        data_manager.basic_config = {**data_manager.basic_config_default, "DATA_PATH": data_path, "STORAGE_TYPE": "JSON"}
+        corpus = make_corpus(random.Random(args.seed), args.messages, args.corpus)
+        for size in args.sizes:
+            await bench_size(size, corpus, args.seed)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,218 @@
+"""
+Offline load test for the ollama cog.
+
+Starts the mock Ollama server from benchmarks.ollama_mock_server, then feeds synthetic mention, DM and chat channel
+messages through Ollama.on_message using fake discord objects and a stub Red bot.
+Reports request throughput, end-to-end latency percentiles and how many discord API calls each reply took,
+so changes to the request pipeline can be compared locally without a GPU.
+
+Run from the repository root with the cog's requirements installed:
+    python -m benchmarks.ollama_benchmark --messages 50 --channels 5 --rate 10 --concurrency 2
+"""
+import argparse
+import asyncio
+import random
+import tempfile
+from collections import Counter
+from contextlib import asynccontextmanager
+from statistics import quantiles
+from time import perf_counter
+from types import SimpleNamespace
+
+import discord
+from redbot.core import data_manager
+
+from benchmarks.ollama_mock_server import MockOllama, add_arguments, settings_from, WORDS
+from ollama.ollama import Ollama
+
+GUILD_ID = 1
+BOT_ID = 2
+USER_ID_START = 1000
+CHANNEL_ID_START = 2000
+MODES = ("mention", "dm", "chat")
+
+
+class StubBotUser:
+    id = BOT_ID
+    bot = True
+
+    def mentioned_in(self, message) -> bool:
+        return self in message.mentions
+
+
+class StubBot:
+    """Implements just enough of Red for the ollama cog."""
+
+    def __init__(self):
+        self.user = StubBotUser()
+        self.loop = asyncio.get_running_loop()
+
+    async def get_context(self, message):
+        return SimpleNamespace(valid=False)
+
+    def get_guild(self, guild_id):
+        return None
+
+
+class FakeMessage:
+    def __init__(self, message_id, content, guild, channel, author, calls, mentions=()):
+        self.id = message_id
+        self.content = content
+        self.guild = guild
+        self.channel = channel
+        self.author = author
+        self.mentions = list(mentions)
+        self.reference = None
+        self.webhook_id = None
+        self.calls = calls
+
+    async def edit(self, content):
+        self.calls["edit"] += 1
+        self.content = content
+
+    async def reply(self, content, **kwargs):
+        self.calls["reply"] += 1
+        return self.channel.record(content)
+
+    async def delete(self):
+        self.calls["delete"] += 1
+
+
+class ChannelMixin:
+    def setup(self, channel_id, guild, calls, bot_user):
+        self.id = channel_id
+        self.guild = guild
+        self.calls = calls
+        self.bot_user = bot_user
+        self.messages = []
+
+    def record(self, content):
+        message = FakeMessage(len(self.messages), content, self.guild, self, self.bot_user, self.calls)
+        self.messages.append(message)
+        return message
+
+    async def send(self, content):
+        self.calls["send"] += 1
+        return self.record(content)
+
+    @asynccontextmanager
+    async def typing(self):
+        self.calls["typing"] += 1
+        yield
+
+    async def history(self, limit):
+        self.calls["history"] += 1
+        for message in self.messages[::-1][:limit]:
+            yield message
+
+
+class FakeTextChannel(ChannelMixin):
+    def __init__(self, channel_id, guild, calls, bot_user):
+        self.setup(channel_id, guild, calls, bot_user)
+
+
+class FakeDMChannel(ChannelMixin, discord.DMChannel):
+    guild = None
+
+    def __init__(self, channel_id, calls, bot_user):
+        self.setup(channel_id, None, calls, bot_user)
+
+
+def make_prompt(rng):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 25)))
+
+
+async def configure(cog, port, args):
+    await cog.config.clear_all()
+    await cog.config.concurrency.set(args.concurrency)
+    await cog.config.max_queue.set(args.messages)
+    scopes = [cog.config.guild_from_id(GUILD_ID)] + [cog.config.user_from_id(USER_ID_START + i) for i in range(args.channels)]
+    for scope in scopes:
+        await scope.api_hostname.set("http://127.0.0.1")
+        await scope.api_port.set(port)
+        await scope.model.set("mock")
+        await scope.stream.set(not args.no_stream)
+        await scope.memory.set(args.memory)
+    await cog.config.guild_from_id(GUILD_ID).chats.set([CHANNEL_ID_START + i for i in range(args.channels)])
+
+
+def make_messages(mode, bot, calls, rng, args):
+    guild = SimpleNamespace(id=GUILD_ID, name="benchmark")
+    messages = []
+    channels = []
+    for i in range(args.channels):
+        if mode == "dm":
+            channels.append(FakeDMChannel(CHANNEL_ID_START + args.channels + i, calls, bot.user))
+        elif mode == "chat":
+            channels.append(FakeTextChannel(CHANNEL_ID_START + i, guild, calls, bot.user))
+        else:
+            channels.append(FakeTextChannel(CHANNEL_ID_START + 2 * args.channels + i, guild, calls, bot.user))
+    for i in range(args.messages):
+        channel = channels[i % args.channels]
+        author = SimpleNamespace(id=USER_ID_START + i % args.channels, bot=False)
+        mentions = [bot.user] if mode == "mention" else []
+        content = f"<@{BOT_ID}> {make_prompt(rng)}" if mode == "mention" else make_prompt(rng)
+        message = FakeMessage(10**6 + i, content, channel.guild, channel, author, calls, mentions)
+        channel.messages.append(message)
+        messages.append(message)
+    for channel in channels:
+        channel.messages.clear()  # history only holds what was sent before each message
+    return messages
+
+
+async def run_mode(mode, port, args):
+    bot = StubBot()
+    cog = Ollama(bot)
+    await configure(cog, port, args)
+    await cog.cog_load()
+    calls = Counter()
+    messages = make_messages(mode, bot, calls, random.Random(args.seed), args)
+
+    latencies = []
+
+    async def deliver(message, delay):
+        await asyncio.sleep(delay)
+        message.channel.messages.append(message)
+        start = perf_counter()
+        await cog.on_message(message)
+        latencies.append(perf_counter() - start)
+
+    start = perf_counter()
+    await asyncio.gather(*(deliver(message, i / args.rate) for i, message in enumerate(messages)))
+    elapsed = perf_counter() - start
+
+    await asyncio.gather(*cog.background)
+    await cog.cog_unload()
+    percentiles = quantiles(latencies, n=100)
+    api_calls = sum(calls.values())
+    print(f"{mode:<8} {len(messages) / elapsed:>6.2f} req/s   p50 {percentiles[49]:>6.2f}s   p95 {percentiles[94]:>6.2f}s   "
+          f"p99 {percentiles[98]:>6.2f}s   {api_calls / len(messages):>5.2f} discord calls/reply "
+          f"({', '.join(f'{name} {count}' for name, count in sorted(calls.items()))})")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=50, help="messages per mode")
+    parser.add_argument("--channels", type=int, default=5, help="channels, and users, the messages are spread across")
+    parser.add_argument("--rate", type=float, default=10.0, help="messages arriving per second")
+    parser.add_argument("--concurrency", type=int, default=1, help="requests the cog may run at once")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--no-stream", action="store_true", help="wait for whole responses instead of streaming")
+    parser.add_argument("--memory", action="store_true", help="recall older turns in DMs and chat channels")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    server = MockOllama(settings_from(args))
+    port = await server.start()
+    try:
+        with tempfile.TemporaryDirectory() as data_path:
+            data_manager.basic_config = {**data_manager.basic_config_default, "DATA_PATH": data_path, "STORAGE_TYPE": "JSON"}
+            for mode in args.modes:
+                await run_mode(mode, port, args)
+    finally:
+        await server.stop()
+    print(f"mock server: {server.requests} requests, {server.embeddings} embeddings, {server.errors} injected errors")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,172 @@
+"""
+Local stand-in for the Ollama HTTP API, for exercising the ollama cog without a GPU.
+
+Serves /api/tags, /api/chat and /api/embed with a configurable delay before the first token, token rate, and error injection.
+Responses stream as newline-delimited JSON or come back whole, depending on the request's `stream` field,
+and end with the same timing fields a real server reports.
+
+Run from the repository root to point a bot at it:
+    python -m benchmarks.ollama_mock_server --port 11434 --tokens-per-second 40 --error-rate 0.05
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import zlib
+from dataclasses import dataclass
+
+from aiohttp import web
+
+WORDS = ["the", "cat", "sat", "on", "a", "warm", "mat", "and", "thought", "about", "tuna", "while", "the", "sun",
+         "moved", "slowly", "across", "sky", "because", "naps", "are", "important", "for", "everyone", "."]
+
+
+@dataclass
+class MockSettings:
+    models: tuple = ("mock:latest",)
+    first_token_delay: float = 0.2  # seconds before the first token, like prompt evaluation
+    tokens_per_second: float = 50.0
+    response_tokens: int = 60
+    load_time: float = 0.0  # added to the first request for each model, like loading weights
+    error_rate: float = 0.0  # share of requests answered with a 500
+    stream_error_rate: float = 0.0  # share of streamed requests that fail halfway through
+    seed: int = 0
+    embedding_size: int = 256
+
+
+class MockOllama:
+    def __init__(self, settings=None):
+        self.settings = settings or MockSettings()
+        self.rng = random.Random(self.settings.seed)
+        self.loaded = set()
+        self.requests = 0
+        self.embeddings = 0
+        self.errors = 0
+        self.app = web.Application()
+        self.app.add_routes([web.get("/api/tags", self.tags), web.post("/api/chat", self.chat), web.post("/api/embed", self.embed)])
+        self.runner = None
+        self.port = None
+
+    async def start(self, host="127.0.0.1", port=0):
+        self.runner = web.AppRunner(self.app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        self.port = self.runner.addresses[0][1]
+        return self.port
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+    async def tags(self, request):
+        return web.json_response({"models": [{"name": name, "model": name, "size": 0} for name in self.settings.models]})
+
+    async def embed(self, request):
+        """Bag of words vectors, so texts sharing words come out similar."""
+        self.embeddings += 1
+        payload = await request.json()
+        texts = payload["input"] if isinstance(payload["input"], list) else [payload["input"]]
+        vectors = []
+        for text in texts:
+            vector = [0.0] * self.settings.embedding_size
+            for word in text.lower().split():
+                vector[zlib.crc32(word.encode()) % self.settings.embedding_size] += 1.0
+            vectors.append(vector)
+        return web.json_response({"model": payload.get("model", ""), "embeddings": vectors})
+
+    async def chat(self, request):
+        self.requests += 1
+        payload = await request.json()
+        model = payload.get("model", "")
+        tag = model if ":" in model else f"{model}:latest"
+        if tag not in self.settings.models:
+            return web.json_response({"error": f"model '{model}' not found"}, status=404)
+        if self.rng.random() < self.settings.error_rate:
+            self.errors += 1
+            return web.json_response({"error": "injected failure"}, status=500)
+
+        start = time.perf_counter()
+        load = 0.0
+        if tag not in self.loaded:
+            self.loaded.add(tag)
+            load = self.settings.load_time
+            await asyncio.sleep(load)
+        prompt_tokens = sum(len(message.get("content", "").split()) + 4 for message in payload.get("messages", []))
+        if not payload.get("messages"):  # only loading the model
+            return web.json_response(self.final(model, start, load, 0, 0, 0.0, ""))
+        await asyncio.sleep(self.settings.first_token_delay)
+
+        count = self.settings.response_tokens
+        interval = 1 / self.settings.tokens_per_second
+        words = [self.rng.choice(WORDS) for _ in range(count)]
+        if not payload.get("stream", True):
+            await asyncio.sleep(interval * count)
+            return web.json_response(self.final(model, start, load, prompt_tokens, count, interval * count, " ".join(words)))
+
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        fail_at = self.rng.randrange(count) if self.rng.random() < self.settings.stream_error_rate else None
+        eval_start = time.perf_counter()
+        for i, word in enumerate(words):
+            if i == fail_at:
+                self.errors += 1
+                await response.write(json.dumps({"error": "injected failure while generating"}).encode() + b"\n")
+                return response
+            chunk = {"model": model, "message": {"role": "assistant", "content": word + " "}, "done": False}
+            await response.write(json.dumps(chunk).encode() + b"\n")
+            await asyncio.sleep(interval)
+        final = self.final(model, start, load, prompt_tokens, count, time.perf_counter() - eval_start, "")
+        await response.write(json.dumps(final).encode() + b"\n")
+        await response.write_eof()
+        return response
+
+    @staticmethod
+    def final(model, start, load, prompt_tokens, eval_count, eval_time, content):
+        return {
+            "model": model,
+            "message": {"role": "assistant", "content": content},
+            "done": True,
+            "total_duration": int((time.perf_counter() - start) * 1e9),
+            "load_duration": int(load * 1e9),
+            "prompt_eval_count": prompt_tokens,
+            "eval_count": eval_count,
+            "eval_duration": int(eval_time * 1e9),
+        }
+
+
+def add_arguments(parser):
+    defaults = MockSettings()
+    parser.add_argument("--first-token-delay", type=float, default=defaults.first_token_delay)
+    parser.add_argument("--tokens-per-second", type=float, default=defaults.tokens_per_second)
+    parser.add_argument("--response-tokens", type=int, default=defaults.response_tokens)
+    parser.add_argument("--load-time", type=float, default=defaults.load_time)
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate)
+    parser.add_argument("--stream-error-rate", type=float, default=defaults.stream_error_rate)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+
+
+def settings_from(args):
+    return MockSettings(first_token_delay=args.first_token_delay, tokens_per_second=args.tokens_per_second,
+                        response_tokens=args.response_tokens, load_time=args.load_time, error_rate=args.error_rate,
+                        stream_error_rate=args.stream_error_rate, seed=args.seed)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    add_arguments(parser)
+    args = parser.parse_args()
+    server = MockOllama(settings_from(args))
+    port = await server.start(args.host, args.port)
+    print(f"Mock Ollama listening on http://{args.host}:{port}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
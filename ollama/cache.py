@@ -0,0 +1,62 @@
+import re
+import time
+from collections import OrderedDict
+
+MAX_CACHE_BYTES = 4 * 1024 * 1024
+CACHE_TTL = 3600  # seconds
+
+_mentions = re.compile(r"<@[!&]?\d+>")
+_whitespace = re.compile(r"\s+")
+
+
+def normalize_prompt(text):
+    """Makes prompts that only differ in mentions, case or spacing share a cache entry."""
+    return _whitespace.sub(" ", _mentions.sub("", text)).strip().casefold()
+
+
+class ResponseCache:
+    """Remembers recent responses to one-off prompts, dropping the least recently used once it holds too many bytes."""
+
+    def __init__(self, max_bytes=MAX_CACHE_BYTES, ttl=CACHE_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self.entries = OrderedDict()  # key -> (expiry, response)
+
+    @staticmethod
+    def key(model, prompt):
+        return model, normalize_prompt(prompt)
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expiry, response = entry
+        if time.monotonic() > expiry:
+            self._pop(key)
+            return None
+        self.entries.move_to_end(key)
+        return response
+
+    def put(self, key, response):
+        size = self._size(key, response)
+        if size > self.max_bytes:
+            return
+        if key in self.entries:
+            self._pop(key)
+        self.entries[key] = (time.monotonic() + self.ttl, response)
+        self.size += size
+        while self.size > self.max_bytes:
+            self._pop(next(iter(self.entries)))
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+    def _pop(self, key):
+        _, response = self.entries.pop(key)
+        self.size -= self._size(key, response)
+
+    @staticmethod
+    def _size(key, response):
+        return len(key[0].encode()) + len(key[1].encode()) + len(response.encode())
@@ -0,0 +1,66 @@
+import re
+from collections import OrderedDict
+
+DEFAULT_CONTEXT_TOKENS = 2048
+MESSAGE_OVERHEAD = 4  # tokens the chat template adds around each message
+LOW_WATERMARK = 0.6  # share of the budget left after trimming, so the next few turns fit without trimming again
+MAX_TRACKED_CHANNELS = 500
+
+_pieces = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text):
+    """A quick guess at how many tokens a model will see, without loading a tokenizer.
+    Latin words take about one token per four characters, other scripts and punctuation about one per character."""
+    tokens = 0
+    for piece in _pieces.findall(text):
+        tokens += (len(piece) + 3) // 4 if piece.isascii() else len(piece)
+    return tokens
+
+
+def message_tokens(message):
+    return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD
+
+
+def fit(turns, budget):
+    """The newest turns that fit in the budget, always keeping the last one."""
+    return turns[ContextTrimmer._cut([message_tokens(turn) for turn in turns], budget):]
+
+
+class ContextTrimmer:
+    """Fits conversations into a token budget by dropping the oldest turns.
+    Trimming cuts well below the budget and then keeps the same first turn for as long as everything fits,
+    so the start of the prompt stays the same between turns and Ollama can reuse its cached evaluation of it."""
+
+    def __init__(self, max_channels=MAX_TRACKED_CHANNELS):
+        self.max_channels = max_channels
+        self.starts = OrderedDict()  # channel id -> first turn sent last time
+
+    def trim(self, channel_id, turns, budget):
+        sizes = [message_tokens(turn) for turn in turns]
+        if channel_id in self.starts:
+            start = self.starts[channel_id]
+            first = next((i for i, turn in enumerate(turns) if turn is start), None)
+        else:
+            first = 0
+        # the first turn fell out of the history, or everything no longer fits
+        if first is None or sum(sizes[first:]) > budget:
+            first = self._cut(sizes, budget * LOW_WATERMARK)
+        self.starts[channel_id] = turns[first] if turns else None
+        self.starts.move_to_end(channel_id)
+        while len(self.starts) > self.max_channels:
+            self.starts.popitem(last=False)
+        return turns[first:]
+
+    def discard(self, channel_id):
+        self.starts.pop(channel_id, None)
+
+    @staticmethod
+    def _cut(sizes, target):
+        """Index of the oldest turn to keep so the rest fit in target tokens, always keeping the newest turn."""
+        total = 0
+        for i in range(len(sizes) - 1, -1, -1):
+            total += sizes[i]
+            if total > target:
+                return min(i + 1, len(sizes) - 1)
+        return 0
@@ -0,0 +1,41 @@
+from collections import OrderedDict, deque
+
+NEW_CHAT_MARKER = "New Chat Initialized."
+MAX_CACHED_CHANNELS = 500
+MAX_TURNS = 500  # turns kept per channel, the context trimmer decides how many of them are sent
+
+
+class ConversationCache:
+    """Keeps the latest turns of each chat channel in memory, so they don't need to be fetched from discord.
+    A channel only has history here once it was loaded, after a restart or eviction it needs to be fetched again.
+    Turns keep piling up after the load, up to max_turns, so the oldest turn sent only changes when the trimmer cuts."""
+
+    def __init__(self, max_channels=MAX_CACHED_CHANNELS, max_turns=MAX_TURNS):
+        self.max_channels = max_channels
+        self.max_turns = max_turns
+        self.channels = OrderedDict()
+
+    def get(self, channel_id):
+        """Returns the cached turns of a channel, or None if they need to be fetched."""
+        turns = self.channels.get(channel_id)
+        if turns is None:
+            return None
+        self.channels.move_to_end(channel_id)
+        return list(turns)
+
+    def load(self, channel_id, turns):
+        self.channels[channel_id] = deque(turns, maxlen=self.max_turns)
+        self.channels.move_to_end(channel_id)
+        while len(self.channels) > self.max_channels:
+            self.channels.popitem(last=False)
+
+    def append(self, channel_id, turn):
+        turns = self.channels.get(channel_id)
+        if turns is not None:
+            turns.append(turn)
+
+    def reset(self, channel_id):
+        self.load(channel_id, [])
+
+    def discard(self, channel_id):
+        self.channels.pop(channel_id, None)
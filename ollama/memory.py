@@ -0,0 +1,192 @@
+import asyncio
+import json
+import logging
+from collections import OrderedDict
+
+import numpy as np
+
+MAX_MEMORIES = 4000  # turns kept per channel, the oldest half is forgotten when it fills up
+MAX_LOADED_CHANNELS = 50
+MIN_SIMILARITY = 0.35
+
+log = logging.getLogger("red.divine-cogs.ollama")
+
+
+class ChannelMemory:
+    """Past turns of a channel and their embeddings, as rows of a float16 matrix that grows as needed."""
+
+    def __init__(self, vectors=None, turns=None, authors=None):
+        self.turns = turns or []
+        self.authors = authors or [None] * len(self.turns)  # user id of each turn, None for the bot's own
+        self.vectors = vectors
+        self.dirty = False
+
+    def add(self, turn, vector, author_id=None):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if not norm:
+            return
+        if self.vectors is None or self.vectors.shape[1] != len(vector):  # new channel, or a different embedding model
+            self.vectors = np.zeros((16, len(vector)), dtype=np.float16)
+            self.turns = []
+            self.authors = []
+        count = len(self.turns)
+        if count == len(self.vectors):
+            if count >= MAX_MEMORIES:
+                keep = MAX_MEMORIES // 2
+                self.vectors[:keep] = self.vectors[count - keep:count]
+                self.turns = self.turns[-keep:]
+                self.authors = self.authors[-keep:]
+                count = keep
+            else:
+                grown = np.zeros((min(count * 2, MAX_MEMORIES), self.vectors.shape[1]), dtype=np.float16)
+                grown[:count] = self.vectors
+                self.vectors = grown
+        self.vectors[count] = vector / norm
+        self.turns.append(turn)
+        self.authors.append(author_id)
+        self.dirty = True
+
+    def snapshot(self):
+        """A copy of the embeddings, and the turns with their authors, as saved to disk."""
+        count = len(self.turns)
+        vectors = self.vectors[:count].copy() if count else None
+        return vectors, [{**turn, "author_id": author_id} for turn, author_id in zip(self.turns, self.authors)]
+
+    def forget_user(self, user_id):
+        """Removes every turn written by the user, returning whether there were any."""
+        keep = [i for i, author_id in enumerate(self.authors) if author_id != user_id]
+        if len(keep) == len(self.turns):
+            return False
+        self.vectors = self.vectors[keep] if keep else None
+        self.turns = [self.turns[i] for i in keep]
+        self.authors = [self.authors[i] for i in keep]
+        self.dirty = True
+        return True
+
+    def search(self, vector, k, exclude=()):
+        """The k turns most similar to vector, oldest first, skipping any whose content is in exclude."""
+        count = len(self.turns)
+        if not count or self.vectors.shape[1] != len(vector):
+            return []
+        query = np.asarray(vector, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        scores = self.vectors[:count].astype(np.float32) @ query
+        candidates = min(count, k + len(exclude))
+        top = np.argpartition(-scores, candidates - 1)[:candidates]
+        top = top[np.argsort(-scores[top])]
+        hits = [i for i in top if scores[i] >= MIN_SIMILARITY and self.turns[i]["content"] not in exclude][:k]
+        return [self.turns[i] for i in sorted(hits)]
+
+
+class MemoryStore:
+    """Loads channel memories from disk when needed, keeping the most recently used ones in memory.
+    Each channel is saved as a .npy matrix of embeddings next to a .json list of the turns.
+    Files are read and written in a worker thread, one operation at a time."""
+
+    def __init__(self, path, max_channels=MAX_LOADED_CHANNELS):
+        self.path = path
+        self.max_channels = max_channels
+        self.channels = OrderedDict()
+        self.loading = {}  # channel id -> task loading it
+        self.lock = asyncio.Lock()
+
+    async def get(self, channel_id):
+        memory = self.channels.get(channel_id)
+        if memory is not None:
+            self.channels.move_to_end(channel_id)
+            return memory
+        task = self.loading.get(channel_id)
+        if task is None:
+            task = self.loading[channel_id] = asyncio.create_task(self._load_channel(channel_id))
+        return await asyncio.shield(task)
+
+    async def flush(self):
+        async with self.lock:
+            await self._write(list(self.channels.items()))
+
+    async def forget_user(self, user_id):
+        """Removes every turn written by the user, from loaded channels and from the ones on disk."""
+        async with self.lock:
+            for memory in self.channels.values():
+                memory.forget_user(user_id)
+            await self._write(list(self.channels.items()))
+            await asyncio.to_thread(self._forget_on_disk, user_id, set(self.channels))
+
+    async def clear(self, channel_id):
+        self.channels.pop(channel_id, None)
+        self.loading.pop(channel_id, None)
+        async with self.lock:
+            await asyncio.to_thread(self._delete, channel_id)
+
+    async def _load_channel(self, channel_id):
+        async with self.lock:
+            memory = await asyncio.to_thread(self._load, channel_id)
+            if self.loading.get(channel_id) is not asyncio.current_task():
+                return memory  # cleared while loading
+            del self.loading[channel_id]
+            self.channels[channel_id] = memory
+            evicted = []
+            while len(self.channels) > self.max_channels:
+                evicted.append(self.channels.popitem(last=False))
+            try:
+                await self._write(evicted)
+            except OSError:
+                log.exception("Failed to save ollama channel memories")
+        return memory
+
+    async def _write(self, channels):
+        """Saves the channels that changed. Their contents are copied first, so they can keep changing meanwhile."""
+        snapshots = []
+        for channel_id, memory in channels:
+            if memory.dirty:
+                memory.dirty = False
+                snapshots.append((channel_id, memory, *memory.snapshot()))
+        if not snapshots:
+            return
+        try:
+            await asyncio.to_thread(self._save_all, [(channel_id, vectors, entries) for channel_id, _, vectors, entries in snapshots])
+        except OSError:
+            for _, memory, _, _ in snapshots:
+                memory.dirty = True
+            raise
+
+    def _load(self, channel_id):
+        vectors_path = self.path / f"{channel_id}.npy"
+        turns_path = self.path / f"{channel_id}.json"
+        if not vectors_path.exists() or not turns_path.exists():
+            return ChannelMemory()
+        try:
+            vectors = np.load(vectors_path)
+            entries = json.loads(turns_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            log.exception(f"Failed to load the memory of channel {channel_id}, starting over")
+            return ChannelMemory()
+        if not entries or len(entries) != len(vectors):
+            return ChannelMemory()
+        turns = [{"role": entry["role"], "content": entry["content"]} for entry in entries]
+        return ChannelMemory(vectors, turns, [entry.get("author_id") for entry in entries])
+
+    def _save_all(self, snapshots):
+        self.path.mkdir(parents=True, exist_ok=True)
+        for channel_id, vectors, entries in snapshots:
+            if not entries:
+                self._delete(channel_id)
+                continue
+            np.save(self.path / f"{channel_id}.npy", vectors)
+            (self.path / f"{channel_id}.json").write_text(json.dumps(entries), encoding="utf-8")
+
+    def _forget_on_disk(self, user_id, skip):
+        if not self.path.exists():
+            return
+        for vectors_path in self.path.glob("*.npy"):
+            channel_id = int(vectors_path.stem)
+            if channel_id in skip:
+                continue
+            memory = self._load(channel_id)
+            if memory.forget_user(user_id):
+                self._save_all([(channel_id, *memory.snapshot())])
+
+    def _delete(self, channel_id):
+        for suffix in (".npy", ".json"):
+            (self.path / f"{channel_id}{suffix}").unlink(missing_ok=True)
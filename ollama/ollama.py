@@ -1,20 +1,67 @@
 from redbot.core import commands, Config
+from redbot.core.data_manager import cog_data_path
 import discord
 import aiohttp
+import asyncio
+import copy
+from collections import OrderedDict
+import logging
+import time
+
+from .streaming import MessageStreamer, iter_ndjson, paginate
+from .webhooks import WebhookPool
+from .history import ConversationCache, NEW_CHAT_MARKER
+from .scheduler import RequestScheduler, QueueFull, RequestDropped
+from .pool import HostPool, model_tag
+from .context import ContextTrimmer, DEFAULT_CONTEXT_TOKENS, message_tokens, fit
+from .cache import ResponseCache
+from .telemetry import Telemetry, generation_sample
+from .memory import MemoryStore
+from .replies import MessageGraph, MAX_REPLY_DEPTH
+
+NUM_PREDICT = 256
+METRICS_INTERVAL = 60  # seconds between writing the metrics file
+MEMORY_SHARE = 0.25  # share of the context kept for turns recalled from memory
+MEMORY_FLUSH_INTERVAL = 120  # seconds between saving channel memories
+MAX_CACHED_EMBEDDINGS = 256
+
+log = logging.getLogger("red.divine-cogs.ollama")
 
 class Ollama(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.config = Config.get_conf(self, identifier=20240203, force_registration=True)
         self.session = aiohttp.ClientSession()
-
-        default_global = {
+        self.webhooks = WebhookPool(bot)
+        self.conversations = ConversationCache()
+        self.scheduler = RequestScheduler()
+        self.pool = HostPool(self.session)
+        self.trimmer = ContextTrimmer()
+        self.responses = ResponseCache()
+        self.telemetry = Telemetry()
+        self.metrics_task = None
+        self.memory = MemoryStore(cog_data_path(self) / "memory")
+        self.memory_task = None
+        self.embeddings = OrderedDict()  # (model, text) -> task, so a message is only embedded once
+        self.background = set()
+        self.replies = MessageGraph()
+
+        self.default_global = {
             "models_blacklist": [],
             "history_limit": 15,
-            "requests": False
+            "requests": False,
+            "concurrency": 1,
+            "max_queue": 10,
+            "context_tokens": DEFAULT_CONTEXT_TOKENS,
+            "model_context": {},
+            "keep_alive": "30m",
+            "metrics_file": False,
+            "embed_model": "nomic-embed-text",
+            "memory_results": 4,
+            "reply_depth": MAX_REPLY_DEPTH
         }
 
-        default_guild = {
+        self.default_guild = {
             "api_hostname": "localhost",
             "api_port": 11434,
             "api_endpoint": "/api/chat",
@@ -22,25 +69,111 @@ class Ollama(commands.Cog):
             "threads": False,
             "bot_name": "",
             "bot_avatar": "",
+            "stream": True,
+            "queue_notice": False,
+            "extra_hosts": [],
+            "response_cache": False,
+            "memory": False,
             "chats": []
         }
         
-        default_user = {
+        self.default_user = {
             "api_hostname": "localhost",
             "api_port": 11434,
             "api_endpoint": "/api/chat",
             "model": "",
             "threads": False,
             "bot_name": "",
-            "bot_avatar": ""
+            "bot_avatar": "",
+            "stream": True,
+            "queue_notice": False,
+            "extra_hosts": [],
+            "memory": False
         }
 
-        self.config.register_guild(**default_guild)
-        self.config.register_user(**default_user)
-        self.config.register_global(**default_global)
+        self.config.register_guild(**self.default_guild)
+        self.config.register_user(**self.default_user)
+        self.config.register_global(**self.default_global)
+
+        # in-memory copies of the config, so that messages can be handled without awaiting it
+        self.global_settings = copy.deepcopy(self.default_global)
+        self.guild_settings = {}
+        self.user_settings = {}
+        self.chat_channels = set()
+
+    async def cog_load(self):
+        self.global_settings = await self.config.all()
+        self.guild_settings = await self.config.all_guilds()
+        self.user_settings = await self.config.all_users()
+        self.chat_channels = {channel_id for settings in self.guild_settings.values() for channel_id in settings["chats"]}
+        self.scheduler.configure(self.global_settings["concurrency"], self.global_settings["max_queue"])
+        self.pool.start()
+        self.metrics_task = asyncio.create_task(self.write_metrics_loop())
+        self.memory_task = asyncio.create_task(self.flush_memory_loop())
+
+    async def cog_unload(self):
+        self.pool.stop()
+        for task in (self.metrics_task, self.memory_task):
+            if task is not None:
+                task.cancel()
+        await self.memory.flush()
+        await self.session.close()
+
+    async def write_metrics_loop(self):
+        while True:
+            await asyncio.sleep(METRICS_INTERVAL)
+            if self.global_settings["metrics_file"]:
+                try:
+                    self.write_metrics()
+                except OSError:
+                    log.exception("Failed to write the ollama metrics file")
+
+    async def flush_memory_loop(self):
+        while True:
+            await asyncio.sleep(MEMORY_FLUSH_INTERVAL)
+            try:
+                await self.memory.flush()
+            except OSError:
+                log.exception("Failed to save ollama channel memories")
+
+    def write_metrics(self):
+        """Writes the telemetry to metrics.prom in the cog's data folder, for a node exporter textfile collector or similar."""
+        path = cog_data_path(self) / "metrics.prom"
+        temp = path.with_suffix(".tmp")
+        temp.write_text(self.telemetry.render())
+        temp.replace(path)
+
+    async def red_delete_data_for_user(self, requester, user_id):
+        await self.memory.forget_user(user_id)
+        await self.config.user_from_id(user_id).clear()
+        self.user_settings.pop(user_id, None)
+
+    def settings(self, guild, user):
+        """The settings for a guild, or for a user's DMs when there is no guild."""
+        if guild is not None:
+            if guild.id not in self.guild_settings:
+                self.guild_settings[guild.id] = copy.deepcopy(self.default_guild)
+            return self.guild_settings[guild.id]
+        if user.id not in self.user_settings:
+            self.user_settings[user.id] = copy.deepcopy(self.default_user)
+        return self.user_settings[user.id]
+
+    async def set_setting(self, ctx, key, value):
+        """Saves a setting for the guild, or for the user's DMs, keeping the in-memory copy in sync."""
+        if ctx.guild is not None:
+            await getattr(self.config.guild(ctx.guild), key).set(value)
+        else:
+            await getattr(self.config.user(ctx.author), key).set(value)
+        self.settings(ctx.guild, ctx.author)[key] = value
 
-    def cog_unload(self):
-        self.bot.loop.create_task(self.session.close())
+    @staticmethod
+    def hosts(settings):
+        """Every API server of a guild or DM, the one set with host and port first."""
+        return [f"{settings['api_hostname']}:{settings['api_port']}"] + settings["extra_hosts"]
+
+    async def set_global_setting(self, key, value):
+        await getattr(self.config, key).set(value)
+        self.global_settings[key] = value
 
     @commands.group(name="ollama")
     async def ollama(self, ctx):
@@ -53,12 +186,8 @@ class Ollama(commands.Cog):
     @ollama.command(name="settings")
     async def showsettings(self, ctx):
         """Displays the current settings for the guild or DM."""
-        if ctx.guild is not None:
-            settings = await self.config.guild(ctx.guild).all()
-            scope = "Guild"
-        else:
-            settings = await self.config.user(ctx.author).all()
-            scope = "DM"
+        settings = self.settings(ctx.guild, ctx.author)
+        scope = "Guild" if ctx.guild is not None else "DM"
         settings_formatted = "\n".join([f"{key}: {value}" for key, value in settings.items()])
         await ctx.send(f"**{scope} Settings:**\n```{settings_formatted}```")
 
@@ -66,87 +195,144 @@ class Ollama(commands.Cog):
     @ollama.command(name="getmodels")
     async def getmodels(self, ctx):
         """Get the available models."""
-        if ctx.guild is not None:
-            config_source = self.config.guild(ctx.guild)
+        blacklist = self.global_settings["models_blacklist"]
+        async with ctx.typing():
+            models = await self.pool.catalog(self.hosts(self.settings(ctx.guild, ctx.author)))
+        if models is None:
+            await ctx.send("Couldn't reach the API to get the models.")
+            return
+        model_names = sorted(model for model in models if model not in blacklist)
+        if model_names:
+            response_message = '\n'.join(model_names)
+            await ctx.send(f"Available models:\n{response_message}")
         else:
-            config_source = self.config.user(ctx.author)
-
-        api_hostname = await config_source.api_hostname()
-        api_port = await config_source.api_port()
-        api_url = f"{api_hostname}:{api_port}/api/tags"
-
-        blacklist = await self.config.models_blacklist()
-        try:
-            async with ctx.typing():
-                async with self.session.get(api_url) as response:
-                    response_text = await response.text()
-                    if response.status == 200:
-                        data = await response.json()
-                        model_names = [model['name'] for model in data['models'] if model['name'] not in blacklist]
-                        if model_names:
-                            response_message = '\n'.join(model_names)
-                            await ctx.send(f"Available models:\n{response_message}")
-                        else:
-                            await ctx.send("There are no available models after applying the blacklist.")
-                    else:
-                        await ctx.send(f"Error contacting the API. Status: {response.status}\nResponse: ```{response_text}```")
-        except Exception as e:
-            await ctx.send(f"An exception occurred: ```{e}```")
+            await ctx.send("There are no available models after applying the blacklist.")
 
     @commands.is_owner()
     @ollama.command(name="getallmodels")
     async def getallmodels(self, ctx):
         """Get all available models (including blacklist)."""
-        if ctx.guild is not None:
-            config_source = self.config.guild(ctx.guild)
+        async with ctx.typing():
+            models = await self.pool.catalog(self.hosts(self.settings(ctx.guild, ctx.author)))
+        if models is None:
+            await ctx.send("Couldn't reach the API to get the models.")
+            return
+        if models:
+            response_message = '\n'.join(sorted(models))
+            await ctx.send(f"Available models:\n{response_message}")
         else:
-            config_source = self.config.user(ctx.author)
-
-        api_hostname = await config_source.api_hostname()
-        api_port = await config_source.api_port()
-        api_url = f"{api_hostname}:{api_port}/api/tags"
-
-        try:
-            async with ctx.typing():
-                async with self.session.get(api_url) as response:
-                    response_text = await response.text()
-                    if response.status == 200:
-                        data = await response.json()
-                        model_names = [model['name'] for model in data['models']]
-                        if model_names:
-                            response_message = '\n'.join(model_names)
-                            await ctx.send(f"Available models:\n{response_message}")
-                        else:
-                            await ctx.send("There are no available models.")
-                    else:
-                        await ctx.send(f"Error contacting the API. Status: {response.status}\nResponse: ```{response_text}```")
-        except Exception as e:
-            await ctx.send(f"An exception occurred: ```{e}```")
+            await ctx.send("There are no available models.")
 
     @commands.is_owner()
     @ollama.command(name="history")
     async def sethistory(self, ctx, history: int):
-        """Set the message history limit."""
-        await self.config.history_limit.set(history)
+        """Set how many messages are fetched when a chat's history isn't cached."""
+        await self.set_global_setting("history_limit", history)
         await ctx.send(f"History updated to `{history}` messages.")
 
+    @commands.is_owner()
+    @ollama.command(name="replydepth")
+    async def setreplydepth(self, ctx, depth: int):
+        """Set how many messages up a reply chain are included when replying outside of chat channels."""
+        depth = max(0, depth)
+        await self.set_global_setting("reply_depth", depth)
+        await ctx.send(f"Reply depth updated to `{depth}` messages.")
+
     @commands.is_owner()
     @ollama.command(name="requests")
     async def requests(self, ctx):
         """Toggles dm'ing when requests are made (very spammy)."""
-        await self.config.requests.set(not await self.config.requests())
-        await ctx.send(f"Requests setting updated to: `{await self.config.requests()}`")
+        await self.set_global_setting("requests", not self.global_settings["requests"])
+        await ctx.send(f"Requests setting updated to: `{self.global_settings['requests']}`")
+
+    @commands.is_owner()
+    @ollama.command(name="stats")
+    async def showstats(self, ctx, group: str = "model"):
+        """Displays how recent generations performed, grouped by `model`, `guild` or `backend`."""
+        groups = self.telemetry.groups.get(group)
+        if groups is None:
+            await ctx.send("Stats can be grouped by `model`, `guild` or `backend`.")
+            return
+        if not groups:
+            await ctx.send("Nothing has been generated yet.")
+            return
+        entries = []
+        for key, stats in groups.items():
+            if group == "guild" and isinstance(key, int):
+                guild = self.bot.get_guild(key)
+                key = guild.name if guild else key
+            summary = stats.summary()
+            entry = f"**{key}** ({stats.total} generations)"
+            for metric, label, unit in (("tokens_per_second", "speed", " tok/s"), ("time_to_first_token", "first token", "s"),
+                                        ("queue_wait", "queue wait", "s"), ("load_time", "load time", "s"),
+                                        ("prompt_tokens", "prompt", " tokens")):
+                if metric in summary:
+                    average, median, p95 = summary[metric]
+                    entry += f"\n└ {label}: {average:.1f}{unit} avg, {median:.1f} p50, {p95:.1f} p95"
+            entries.append(entry)
+        for page in paginate("\n".join(entries)):
+            await ctx.send(page)
+
+    @commands.is_owner()
+    @ollama.command(name="metricsfile")
+    async def metricsfile(self, ctx):
+        """Toggles writing generation stats to a Prometheus text file in the cog's data folder every minute."""
+        await self.set_global_setting("metrics_file", not self.global_settings["metrics_file"])
+        if self.global_settings["metrics_file"]:
+            await ctx.send(f"Metrics will be written to `{cog_data_path(self) / 'metrics.prom'}`.")
+        else:
+            await ctx.send("Metrics file turned off.")
+
+    @commands.is_owner()
+    @ollama.command(name="concurrency")
+    async def setconcurrency(self, ctx, concurrency: int):
+        """Set how many requests may run at once on each API server."""
+        concurrency = max(1, concurrency)
+        await self.set_global_setting("concurrency", concurrency)
+        self.scheduler.configure(concurrency, self.global_settings["max_queue"])
+        await ctx.send(f"Concurrency updated to `{concurrency}` requests per server.")
+
+    @commands.is_owner()
+    @ollama.command(name="queuesize")
+    async def setqueuesize(self, ctx, size: int):
+        """Set how many requests may wait for each API server before new ones are turned away."""
+        size = max(0, size)
+        await self.set_global_setting("max_queue", size)
+        self.scheduler.configure(self.global_settings["concurrency"], size)
+        await ctx.send(f"Queue size updated to `{size}` requests per server.")
+
+    @commands.is_owner()
+    @ollama.command(name="context")
+    async def setcontext(self, ctx, tokens: int, *, model: str = None):
+        """Set how many tokens of context a model gets, or the default for every model."""
+        if tokens <= NUM_PREDICT:
+            await ctx.send(f"The context must be larger than the `{NUM_PREDICT}` tokens kept for the response.")
+            return
+        if model is None:
+            await self.set_global_setting("context_tokens", tokens)
+            await ctx.send(f"Default context updated to `{tokens}` tokens.")
+        else:
+            await self.set_global_setting("model_context", {**self.global_settings["model_context"], model: tokens})
+            await ctx.send(f"Context for `{model}` updated to `{tokens}` tokens.")
+
+    @commands.is_owner()
+    @ollama.command(name="keepalive")
+    async def setkeepalive(self, ctx, duration: str):
+        """Set how long models stay loaded after a request, like `30m`, `2h`, or `-1` for forever."""
+        keep_alive = int(duration) if duration.lstrip("-").isdigit() else duration
+        await self.set_global_setting("keep_alive", keep_alive)
+        await ctx.send(f"Keep alive updated to `{duration}`.")
 
     @commands.is_owner()
     @ollama.command(name="addmodeltoblacklist")
     async def add_model_to_blacklist(self, ctx, *, model_name: str):
         """Adds a model to the global models blacklist. Bot owner only."""
-        async with self.config.models_blacklist() as blacklist:
-            if model_name not in blacklist:
-                blacklist.append(model_name)
-                await ctx.send(f"Model `{model_name}` added to the blacklist.")
-            else:
-                await ctx.send(f"Model `{model_name}` is already in the blacklist.")
+        blacklist = self.global_settings["models_blacklist"]
+        if model_name not in blacklist:
+            await self.set_global_setting("models_blacklist", blacklist + [model_name])
+            await ctx.send(f"Model `{model_name}` added to the blacklist.")
+        else:
+            await ctx.send(f"Model `{model_name}` is already in the blacklist.")
 
     ### API SETUP ###
 
@@ -156,30 +342,20 @@ class Ollama(commands.Cog):
         """Set the API hostname."""
         if not hostname.startswith(('http://', 'https://')):
             hostname = f"http://{hostname}"
-        if ctx.guild is not None:
-            await self.config.guild(ctx.guild).api_hostname.set(hostname)
-            config_scope = self.config.guild(ctx.guild)
-            scope = "Guild"
-        else:
-            await self.config.user(ctx.author).api_hostname.set(hostname)
-            config_scope = self.config.user(ctx.author)
-            scope = "DM"
-        full_url = f"{hostname}:{await config_scope.api_port()}{await config_scope.api_endpoint()}"
+        await self.set_setting(ctx, "api_hostname", hostname)
+        settings = self.settings(ctx.guild, ctx.author)
+        scope = "Guild" if ctx.guild is not None else "DM"
+        full_url = f"{hostname}:{settings['api_port']}{settings['api_endpoint']}"
         await ctx.send(f"{scope} API hostname updated. Current API URL: {full_url}")
 
     @commands.admin()
     @ollama.command(name="port")
     async def setport(self, ctx, port: int):
         """Set the API port."""
-        if ctx.guild is not None:
-            await self.config.guild(ctx.guild).api_port.set(port)
-            config_scope = self.config.guild(ctx.guild)
-            scope = "Guild"
-        else:
-            await self.config.user(ctx.author).api_port.set(port)
-            config_scope = self.config.user(ctx.author)
-            scope = "DM"
-        full_url = f"{await config_scope.api_hostname()}:{port}{await config_scope.api_endpoint()}"
+        await self.set_setting(ctx, "api_port", port)
+        settings = self.settings(ctx.guild, ctx.author)
+        scope = "Guild" if ctx.guild is not None else "DM"
+        full_url = f"{settings['api_hostname']}:{port}{settings['api_endpoint']}"
         await ctx.send(f"{scope} API port updated. Current API URL: {full_url}")
 
     @commands.admin()
@@ -188,29 +364,66 @@ class Ollama(commands.Cog):
         """Set the API endpoint."""
         if not endpoint.startswith('/'):
             endpoint = f"/{endpoint}"
-        if ctx.guild is not None:
-            await self.config.guild(ctx.guild).api_endpoint.set(endpoint)
-            config_scope = self.config.guild(ctx.guild)
-            scope = "Guild"
-        else:
-            await self.config.user(ctx.author).api_endpoint.set(endpoint)
-            config_scope = self.config.user(ctx.author)
-            scope = "DM"
-        full_url = f"{await config_scope.api_hostname()}:{await config_scope.api_port()}{endpoint}"
+        await self.set_setting(ctx, "api_endpoint", endpoint)
+        settings = self.settings(ctx.guild, ctx.author)
+        scope = "Guild" if ctx.guild is not None else "DM"
+        full_url = f"{settings['api_hostname']}:{settings['api_port']}{endpoint}"
         await ctx.send(f"{scope} API endpoint updated. Current API URL: {full_url}")
 
+    @commands.admin()
+    @ollama.command(name="addhost")
+    async def addhost(self, ctx, url: str):
+        """Add another API server to share the load with, as hostname:port."""
+        if not url.startswith(('http://', 'https://')):
+            url = f"http://{url}"
+        url = url.rstrip('/')
+        settings = self.settings(ctx.guild, ctx.author)
+        if url in self.hosts(settings):
+            await ctx.send(f"`{url}` is already in use.")
+            return
+        await self.set_setting(ctx, "extra_hosts", settings["extra_hosts"] + [url])
+        await ctx.send(f"Added `{url}`, requests will now be shared between {len(self.hosts(settings))} servers.")
+
+    @commands.admin()
+    @ollama.command(name="removehost")
+    async def removehost(self, ctx, url: str):
+        """Remove an API server added with addhost."""
+        if not url.startswith(('http://', 'https://')):
+            url = f"http://{url}"
+        url = url.rstrip('/')
+        extra_hosts = self.settings(ctx.guild, ctx.author)["extra_hosts"]
+        if url not in extra_hosts:
+            await ctx.send(f"`{url}` isn't one of the added servers.")
+            return
+        await self.set_setting(ctx, "extra_hosts", [host for host in extra_hosts if host != url])
+        await ctx.send(f"Removed `{url}`.")
+
+    @commands.admin()
+    @ollama.command(name="hosts")
+    async def showhosts(self, ctx):
+        """Displays the API servers and how they are doing."""
+        lines = []
+        for url in self.hosts(self.settings(ctx.guild, ctx.author)):
+            host = self.pool.state(url)
+            status = {None: "unchecked", True: "healthy", False: "down"}[host.healthy]
+            if host.circuit_open:
+                status = "skipped after repeated failures"
+            lines.append(f"{url}: {status}, {host.in_flight} in flight, {host.latency:.1f}s average")
+        await ctx.send("```" + "\n".join(lines) + "```")
+
     ### SERVER / DM STUFF ###
 
     @commands.admin()
     @ollama.command(name="model")
     async def setmodel(self, ctx, model: str):
         """Set the model variable."""
-        if ctx.guild is not None:
-            await self.config.guild(ctx.guild).model.set(model)
-            scope = "Guild"
-        else:
-            await self.config.user(ctx.author).model.set(model)
-            scope = "DM"
+        hosts = self.hosts(self.settings(ctx.guild, ctx.author))
+        models = await self.pool.catalog(hosts)
+        if models is not None and (model_tag(model) not in models or model_tag(model) in map(model_tag, self.global_settings["models_blacklist"])):
+            await ctx.send(f"`{model}` isn't one of the available models, see `{ctx.clean_prefix}ollama getmodels`.")
+            return
+        await self.set_setting(ctx, "model", model)
+        self.pool.warm_up(hosts, model, self.global_settings["keep_alive"], self.context_tokens(model))
         await ctx.send("Model variable updated.")
 
     @commands.admin()
@@ -218,22 +431,65 @@ class Ollama(commands.Cog):
     async def setthreads(self, ctx):
         """Toggles responding with a thread."""
         if ctx.guild is not None:
-            await self.config.guild(ctx.guild).threads.set(not await self.config.guild(ctx.guild).threads())
-            await ctx.send(f"Threads setting updated to: {await self.config.guild(ctx.guild).threads()}")
+            threads = not self.settings(ctx.guild, ctx.author)["threads"]
+            await self.set_setting(ctx, "threads", threads)
+            await ctx.send(f"Threads setting updated to: {threads}")
         else:
             await ctx.send("Threads cannot be activated inside private messages.")
 
+    @commands.admin()
+    @ollama.command(name="stream")
+    async def setstream(self, ctx):
+        """Toggles showing responses while they are being generated."""
+        stream = not self.settings(ctx.guild, ctx.author)["stream"]
+        await self.set_setting(ctx, "stream", stream)
+        await ctx.send(f"Stream setting updated to: {stream}")
+
+    @commands.admin()
+    @ollama.command(name="queuenotice")
+    async def setqueuenotice(self, ctx):
+        """Toggles telling users their place in line when the server is busy."""
+        queue_notice = not self.settings(ctx.guild, ctx.author)["queue_notice"]
+        await self.set_setting(ctx, "queue_notice", queue_notice)
+        await ctx.send(f"Queue notice setting updated to: {queue_notice}")
+
+    @commands.admin()
+    @ollama.command(name="cache")
+    async def setcache(self, ctx):
+        """Toggles reusing recent responses when the same question is asked again. Only applies to mentions and replies."""
+        if ctx.guild is not None:
+            response_cache = not self.settings(ctx.guild, ctx.author)["response_cache"]
+            await self.set_setting(ctx, "response_cache", response_cache)
+            await ctx.send(f"Response cache setting updated to: {response_cache}")
+        else:
+            await ctx.send("The response cache cannot be activated inside private messages.")
+
+    @commands.admin()
+    @ollama.command(name="memory")
+    async def setmemory(self, ctx):
+        """Toggles remembering chat channel messages, so older ones relevant to a question can be brought back into context."""
+        memory = not self.settings(ctx.guild, ctx.author)["memory"]
+        await self.set_setting(ctx, "memory", memory)
+        await ctx.send(f"Memory setting updated to: {memory}\nMemories use the `{self.global_settings['embed_model']}` model, "
+                       f"it needs to be available on the API server.")
+
+    @commands.is_owner()
+    @ollama.command(name="embedmodel")
+    async def setembedmodel(self, ctx, model: str):
+        """Set the model used to embed messages for memory."""
+        await self.set_global_setting("embed_model", model)
+        await ctx.send(f"Embedding model updated to `{model}`. Memories made with the previous model will be replaced as new ones are made.")
+
     @ollama.command(name="newchat")
     async def newchat(self, ctx):
         if ctx.guild is not None:
             #thread_name = f"{ctx.author.display_name} Chat"
             #thread = await ctx.message.create_thread(name=thread_name, auto_archive_duration=60)
-            async with self.config.guild(ctx.guild).chats() as chats:
-                if ctx.channel.id not in chats:
-                    chats.append(ctx.channel.id)
-                    await ctx.send("New Chat Initialized.")
-                else:
-                    await ctx.send("New Chat Initialized.")
+            chats = self.settings(ctx.guild, ctx.author)["chats"]
+            if ctx.channel.id not in chats:
+                await self.set_setting(ctx, "chats", chats + [ctx.channel.id])
+                self.chat_channels.add(ctx.channel.id)
+            await ctx.send("New Chat Initialized.")
         else:
             await ctx.send("New Chat Initialized.")
 
@@ -244,9 +500,8 @@ class Ollama(commands.Cog):
         if len(name) > 15:
             await ctx.send("The bot name must be under 15 characters.")
             return
-        if ctx.guild is not None:
-            await self.config.guild(ctx.guild).bot_name.set(name)
-            scope = "Guild"
+        await self.set_setting(ctx, "bot_name", name)
+        scope = "Guild" if ctx.guild is not None else "DM"
         await ctx.send(f"{scope} bot name updated successfully.")
 
     @commands.admin()
@@ -256,96 +511,280 @@ class Ollama(commands.Cog):
         if not url.lower().endswith(('.png', '.jpg', '.jpeg', '.gif')):
             await ctx.send("Please provide a valid image URL. Accepted formats: PNG, JPG, JPEG, GIF")
             return
-        if ctx.guild is not None:
-            await self.config.guild(ctx.guild).bot_avatar.set(url)
-            scope = "Guild"
+        await self.set_setting(ctx, "bot_avatar", url)
+        scope = "Guild" if ctx.guild is not None else "DM"
         await ctx.send(f"{scope} bot avatar updated successfully.")
 
     ### THE SAUCE ###
 
+    def is_chat_channel(self, channel):
+        return isinstance(channel, discord.DMChannel) or channel.id in self.chat_channels
+
     @commands.Cog.listener()
     async def on_message(self, message):
+        if self.is_chat_channel(message.channel):
+            self.remember_turn(message)
+        else:
+            reference = message.reference
+            parent_id = reference.message_id if reference and reference.channel_id == message.channel.id else None
+            if parent_id is not None or message.id not in self.replies:  # the bot's answers are added by send_response
+                self.replies.add(message.id, self.role_of(message), message.content, parent_id)
         if message.author.bot or message.author.id == self.bot.user.id:
             return
+        # or ((message.channel.type == "public_thread" or "private_thread") and message.channel.owner.id == self.bot.user.id)
+        if not (self.bot.user.mentioned_in(message) or (message.reference and message.reference.resolved and message.reference.resolved.author.id == self.bot.user.id) or isinstance(message.channel, discord.DMChannel) or (message.channel.id in self.chat_channels)):
+            return
         ctx = await self.bot.get_context(message)
         if ctx.valid:
             return
-        if message.guild is not None:
-            chats = await self.config.guild(message.guild).chats()
-        # or ((message.channel.type == "public_thread" or "private_thread") and message.channel.owner.id == self.bot.user.id)
-        if self.bot.user.mentioned_in(message) or (message.reference and message.reference.resolved and message.reference.resolved.author.id == self.bot.user.id) or isinstance(message.channel, discord.DMChannel) or (message.channel.id in chats):
-            await self.process_message(message)
+        await self.process_message(message)
+
+    def role_of(self, message):
+        if message.author.id == self.bot.user.id or (message.webhook_id and self.webhooks.owns(message.webhook_id)):
+            return "assistant"
+        return "user"
+
+    def remember_turn(self, message):
+        """Adds a chat channel message to the cached conversation. The bot's own replies are added by send_response."""
+        if message.content == NEW_CHAT_MARKER:
+            self.conversations.reset(message.channel.id)
+            self.trimmer.discard(message.channel.id)
+            self.run_in_background(self.memory.clear(message.channel.id))
+        elif message.author.id != self.bot.user.id and not (message.webhook_id and self.webhooks.owns(message.webhook_id)):
+            turn = {"role": "assistant" if message.author.bot else "user", "content": message.content}
+            self.conversations.append(message.channel.id, turn)
+            settings = self.settings(message.guild, message.author)
+            if settings["memory"] and message.content:
+                self.run_in_background(self.memorize(message, settings, turn, message.author.id))
+
+    def run_in_background(self, coro):
+        task = asyncio.create_task(coro)
+        self.background.add(task)
+        task.add_done_callback(self.background.discard)
+
+    async def embed(self, message, settings, text):
+        """The embedding of a text from the embedding model, or None if it couldn't be made.
+        The request waits its turn in the scheduler like any other, on behalf of the message's author."""
+        key = (self.global_settings["embed_model"], text)
+        task = self.embeddings.get(key)
+        if task is None:
+            task = self.embeddings[key] = asyncio.ensure_future(self.request_embedding(message, settings, *key))
+            while len(self.embeddings) > MAX_CACHED_EMBEDDINGS:
+                self.embeddings.popitem(last=False)
+        vector = await asyncio.shield(task)
+        if vector is None and self.embeddings.get(key) is task:
+            del self.embeddings[key]  # try again next time
+        return vector
+
+    async def request_embedding(self, message, settings, model, text):
+        host = self.pool.pick(self.hosts(settings), model, self.scheduler.load)
+        guild_id = message.guild.id if message.guild is not None else None
+        payload = {"model": model, "input": text, "keep_alive": self.global_settings["keep_alive"]}
+        try:
+            async with self.scheduler.slot(host, guild_id, message.author.id, None):
+                async with self.pool.track(host) as server_error:
+                    async with self.session.post(f"{host}/api/embed", json=payload) as response:
+                        if response.status != 200:
+                            if response.status >= 500:
+                                server_error()
+                            log.warning(f"Failed to embed a message with {model}, status {response.status}: {await response.text()}")
+                            return None
+                        data = await response.json()
+        except QueueFull:
+            return None
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            log.warning(f"Failed to embed a message with {model}: {e}")
+            return None
+        embeddings = data.get("embeddings")
+        return embeddings[0] if embeddings else None
+
+    async def memorize(self, message, settings, turn, author_id):
+        vector = await self.embed(message, settings, turn["content"])
+        if vector is not None:
+            (await self.memory.get(message.channel.id)).add(turn, vector, author_id)
+
+    async def recall(self, message, settings, formatted_messages, budget):
+        """Adds the older turns most relevant to the message, as a system message just before it.
+        It goes last so the start of the prompt stays the same between turns."""
+        vector = await self.embed(message, settings, message.content)
+        if vector is None or not formatted_messages:
+            return formatted_messages
+        exclude = {turn["content"] for turn in formatted_messages}
+        memory = await self.memory.get(message.channel.id)
+        hits = memory.search(vector, self.global_settings["memory_results"], exclude)
+        lines = []
+        for turn in hits:
+            budget -= message_tokens(turn)
+            if budget < 0:
+                break
+            lines.append(f"{turn['role']}: {turn['content']}")
+        if not lines:
+            return formatted_messages
+        recalled = {"role": "system", "content": "Relevant messages from earlier in this conversation:\n" + "\n".join(lines)}
+        return formatted_messages[:-1] + [recalled, formatted_messages[-1]]
+
+    async def get_conversation(self, channel):
+        """The latest turns of a chat channel, only fetched from discord if they aren't cached.
+        history_limit is how many messages are fetched, the cache keeps growing from there."""
+        limit = self.global_settings["history_limit"]
+        formatted_messages = self.conversations.get(channel.id)
+        if formatted_messages is not None:
+            return formatted_messages
+        history = []
+        async for msg in channel.history(limit=limit):
+            if msg.content == NEW_CHAT_MARKER:
+                break
+            history.append(msg)
+        history = history[::-1]
+        formatted_messages = [{"role": "assistant" if msg.author.bot else "user", "content": msg.content} for msg in history]
+        self.conversations.load(channel.id, formatted_messages)
+        return formatted_messages
+
+    def context_tokens(self, model):
+        return self.global_settings["model_context"].get(model, self.global_settings["context_tokens"])
 
     async def process_message(self, message):
-        if message.guild is not None:
-            threads = await self.config.guild(message.guild).threads()
-            chats = await self.config.guild(message.guild).chats()
-        else:
-            threads = False
         #  or ((message.channel.type == "public_thread" or "private_thread") and message.channel.owner.id == self.bot.user.id)
-        if isinstance(message.channel, discord.DMChannel) or (message.guild and message.channel.id in chats):
-            history = []
-            async for msg in message.channel.history(limit=await self.config.history_limit()):
-                if msg.content == "New Chat Initialized.":
-                    break
-                history.append(msg)
-            history = history[::-1]
-            formatted_messages = [{"role": "assistant" if msg.author.bot or message.author.id == self.bot.user.id else "user", "content": msg.content} for msg in history]
+        if self.is_chat_channel(message.channel):
+            formatted_messages = await self.get_conversation(message.channel)
+            settings = self.settings(message.guild, message.author)
+            budget = self.context_tokens(settings["model"]) - NUM_PREDICT
+            memory_budget = int(budget * MEMORY_SHARE) if settings["memory"] else 0
+            formatted_messages = self.trimmer.trim(message.channel.id, formatted_messages, budget - memory_budget)
+            if memory_budget:
+                formatted_messages = await self.recall(message, settings, formatted_messages, memory_budget)
             await self.send_response(message, formatted_messages)
         else:
             formatted_message = [{"role": "user", "content": message.content}]
-            await self.send_response(message, formatted_message)
-
-    async def send_response(self, message, formatted_messages):
-        if message.guild is not None:
-            model = await self.config.guild(message.guild).model()
-        else:
-            model = await self.config.user(message.author).model()
+            settings = self.settings(message.guild, message.author)
+            if message.reference is not None:
+                chain = await self.replies.chain(message, self.role_of, self.global_settings["reply_depth"])
+                formatted_message = fit(chain + formatted_message, self.context_tokens(settings["model"]) - NUM_PREDICT)
+            use_cache = message.guild is not None and settings["response_cache"] and len(formatted_message) == 1
+            cache_key = ResponseCache.key(settings["model"], message.content) if use_cache else None
+            await self.send_response(message, formatted_message, cache_key)
+
+    async def send_response(self, message, formatted_messages, cache_key=None):
+        settings = self.settings(message.guild, message.author)
+        stream = settings["stream"]
         json_payload = {
-            "model": model,
+            "model": settings["model"],
             "messages": formatted_messages,
-            "stream": False,
+            "stream": stream,
+            "keep_alive": self.global_settings["keep_alive"],
             "options": {
-                "num_predict": 256
+                "num_ctx": self.context_tokens(settings["model"]),
+                "num_predict": NUM_PREDICT
             }
         }
-        if message.guild is not None:
-            config_source = self.config.guild(message.guild)
-        else:
-            config_source = self.config.user(message.author)
-
-        api_hostname = await config_source.api_hostname()
-        api_port = await config_source.api_port()
-        api_endpoint = await config_source.api_endpoint()
-        api_url = f"{api_hostname}:{api_port}{api_endpoint}"
-        bot_name = await config_source.bot_name()
-        bot_avatar = await config_source.bot_avatar()
-        
+
+        host = self.pool.pick(self.hosts(settings), settings["model"], self.scheduler.load)
+        api_url = f"{host}{settings['api_endpoint']}"
+        bot_name = settings["bot_name"]
+        bot_avatar = settings["bot_avatar"]
+
+        use_webhook = (bot_name or bot_avatar) and message.guild is not None
+        parent_id = None if self.is_chat_channel(message.channel) else message.id
+
+        async def send(text):
+            nonlocal parent_id
+            if use_webhook:
+                sent = await self.webhooks.send(message.channel, text, bot_name or None, bot_avatar or None)
+            else:
+                sent = await message.channel.send(text)
+            if parent_id is not None:  # so replying to any page of the answer also includes the question above it
+                self.replies.add(sent.id, "assistant", text, parent_id)
+                parent_id = sent.id
+            return sent
+
+        if cache_key is not None:
+            cached = self.responses.get(cache_key)
+            if cached is not None:
+                for page in paginate(cached):
+                    await send(page)
+                return
+
+        notice = None
+
+        async def on_queued(position):
+            nonlocal notice
+            if settings["queue_notice"]:
+                notice = await message.reply(f"⏳ You're number {position} in line, I'll get to you soon.", mention_author=False)
+
+        guild_id = message.guild.id if message.guild is not None else None
+        queued_at = time.monotonic()
         try:
-            async with message.channel.typing():
-                async with self.session.post(api_url, json=json_payload) as response:
-                    response_text = await response.text()
-                    if response.status == 200:
-                        data = await response.json()
-                        if await self.config.requests():
-                            await message.author.send(f"Sent\n```{json_payload}```\nReceived\n```{data}```")
-                        response_message = data.get("message", {}).get("content")
-                        if not response_message or response_message.isspace():
-                            await self.send_response(message, formatted_messages)
-                            return
-                        if bot_name is not None and bot_avatar is not None and isinstance(message.channel, discord.DMChannel) is False:
-                            webhook = await message.channel.create_webhook(name=bot_name)
-                            await webhook.send(str(f"{response_message}"), username=bot_name, avatar_url=bot_avatar)
-                            webhooks = await message.channel.webhooks()
-                            for webhook_obj in webhooks:
-                                await webhook_obj.delete()
-                        else:
-                            await message.channel.send(f"{response_message}")
-                    else:
-                        await message.channel.send(f"Error contacting the API. Status: {response.status}\nResponse: ```{response_text}```")
+            async with self.scheduler.slot(host, guild_id, message.author.id, message.id, on_queued):
+                started_at = time.monotonic()
+                first_token_at = None
+                if notice is not None:
+                    await notice.delete()
+                async with self.pool.track(host) as server_error:
+                    async with message.channel.typing():
+                        async with self.session.post(api_url, json=json_payload) as response:
+                            if response.status != 200:
+                                if response.status >= 500:
+                                    server_error()
+                                response_text = await response.text()
+                                await message.channel.send(f"Error contacting the API. Status: {response.status}\nResponse: ```{response_text}```")
+                                return
+                            if stream:
+                                streamer = MessageStreamer(send)
+                                data = {}
+                                async for data in iter_ndjson(response):
+                                    if "error" in data:
+                                        raise RuntimeError(data["error"])
+                                    chunk = data.get("message", {}).get("content", "")
+                                    if chunk and first_token_at is None:
+                                        first_token_at = time.monotonic()
+                                    await streamer.feed(chunk)
+                                    if data.get("done"):
+                                        break
+                                await streamer.finish()
+                                response_message = streamer.full_text
+                            else:
+                                data = await response.json()  # no first token time, the whole response arrives at once
+                                response_message = data.get("message", {}).get("content")
+            if data.get("done"):
+                time_to_first_token = first_token_at - started_at if first_token_at is not None else None
+                self.telemetry.record(settings["model"], guild_id, host, generation_sample(data, started_at - queued_at, time_to_first_token))
+            if self.global_settings["requests"]:
+                await message.author.send(f"Sent\n```{json_payload}```\nReceived\n```{data}```")
+            if not response_message or response_message.isspace():
+                await self.send_response(message, formatted_messages, cache_key)
+                return
+            if not stream:
+                for page in paginate(response_message):
+                    await send(page)
+            if self.is_chat_channel(message.channel):
+                turn = {"role": "assistant", "content": response_message}
+                self.conversations.append(message.channel.id, turn)
+                if settings["memory"]:
+                    self.run_in_background(self.memorize(message, settings, turn, None))
+            elif cache_key is not None:
+                self.responses.put(cache_key, response_message)
+        except QueueFull:
+            await message.reply("Sorry, I'm a bit busy right now. Please try again in a minute!", mention_author=False)
+        except RequestDropped:
+            if notice is not None:
+                await notice.delete()
         except Exception as e:
             await message.channel.send(f"An exception occurred: ```{e}```")
 
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload):
+        self.scheduler.drop_message(payload.message_id)
+        self.replies.discard(payload.message_id)
+
+    @commands.Cog.listener()
+    async def on_raw_message_edit(self, payload):
+        if "content" in payload.data:
+            self.replies.edit(payload.message_id, payload.data["content"])
+
+    @commands.Cog.listener()
+    async def on_webhooks_update(self, channel):
+        self.webhooks.invalidate(channel.id)
+
 async def setup(bot):
     cog = Ollama(bot)
     bot.add_cog(cog)
@@ -0,0 +1,156 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+import aiohttp
+
+PROBE_INTERVAL = 30  # seconds between health checks of every known host
+PROBE_TIMEOUT = 5
+FAILURE_THRESHOLD = 3  # consecutive failures before a host's circuit opens
+COOLDOWN = 60  # seconds an open circuit stays open before one request may try the host again
+IDLE_TIMEOUT = 3600  # hosts that weren't picked for this long stop being probed
+LATENCY_SMOOTHING = 0.3
+CATALOG_TTL = 300  # seconds the model list of a host is trusted before asking again
+
+
+def model_tag(model):
+    """Ollama lists models with their tag, a model set without one means :latest."""
+    return model if ":" in model else f"{model}:latest"
+
+
+class HostState:
+    def __init__(self, url):
+        self.url = url
+        self.healthy = None  # None until the first probe
+        self.models = None  # names from /api/tags, None until the first successful probe
+        self.checked_at = None
+        self.in_flight = 0
+        self.latency = 0.0  # smoothed seconds per request
+        self.failures = 0
+        self.open_until = 0.0
+        self.last_used = time.monotonic()
+
+    @property
+    def circuit_open(self):
+        return self.failures >= FAILURE_THRESHOLD and time.monotonic() < self.open_until
+
+    def has_model(self, model):
+        return not model or self.models is None or model_tag(model) in self.models
+
+    def succeeded(self, elapsed=None):
+        self.failures = 0
+        self.healthy = True
+        if elapsed is not None:
+            self.latency = elapsed if not self.latency else self.latency + LATENCY_SMOOTHING * (elapsed - self.latency)
+
+    def failed(self):
+        self.failures += 1
+        if self.failures >= FAILURE_THRESHOLD:
+            self.healthy = False
+            self.open_until = time.monotonic() + COOLDOWN
+
+
+class HostPool:
+    """Tracks the health and load of every Ollama server in use, and picks which one a request should go to.
+    Servers are probed in the background, and a server that keeps failing is skipped until its cooldown ends."""
+
+    def __init__(self, session):
+        self.session = session
+        self.hosts = {}
+        self.task = None
+        self.warmups = set()
+
+    def start(self):
+        self.task = asyncio.create_task(self.probe_loop())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+
+    def state(self, url):
+        host = self.hosts.get(url)
+        if host is None:
+            host = self.hosts[url] = HostState(url)
+        return host
+
+    def pick(self, urls, model, load=None):
+        """The least loaded usable host out of urls. When none look usable the first one is returned,
+        so the user gets the real error instead of silence.
+        load gives how many requests are running on or queued for a host, otherwise only requests in flight are counted."""
+        hosts = [self.state(url) for url in urls]
+        usable = [host for host in hosts if host.healthy is not False and not host.circuit_open and host.has_model(model)]
+        if not usable:
+            # an open circuit whose cooldown ended gets a single trial request
+            usable = [host for host in hosts if host.healthy is False and not host.circuit_open and host.has_model(model)]
+        host = min(usable, key=lambda h: (load(h.url) if load else h.in_flight, h.latency)) if usable else hosts[0]
+        host.last_used = time.monotonic()
+        return host.url
+
+    @asynccontextmanager
+    async def track(self, url):
+        """Counts a request as in flight on a host, and records how it went.
+        Yields a function to call when the host answered with a server error."""
+        host = self.state(url)
+        host.in_flight += 1
+        start = time.monotonic()
+        errors = []
+        try:
+            yield lambda: errors.append(True)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            host.failed()
+            raise
+        else:
+            if errors:
+                host.failed()
+            else:
+                host.succeeded(time.monotonic() - start)
+        finally:
+            host.in_flight -= 1
+
+    async def probe(self, host):
+        try:
+            timeout = aiohttp.ClientTimeout(total=PROBE_TIMEOUT)
+            async with self.session.get(f"{host.url}/api/tags", timeout=timeout) as response:
+                if response.status != 200:
+                    host.failed()
+                    return
+                data = await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            host.failed()
+            return
+        host.models = {model["name"] for model in data.get("models", [])}
+        host.checked_at = time.monotonic()
+        host.succeeded()
+
+    async def catalog(self, urls):
+        """Every model available on the reachable hosts out of urls, or None if none of them could be reached.
+        Model lists are kept up to date by the probes, and only fetched here when they are missing or stale."""
+        hosts = [self.state(url) for url in urls]
+        now = time.monotonic()
+        await asyncio.gather(*(self.probe(host) for host in hosts if host.checked_at is None or now - host.checked_at > CATALOG_TTL))
+        known = [host.models for host in hosts if host.models is not None and host.healthy is not False]
+        return set().union(*known) if known else None
+
+    def warm_up(self, urls, model, keep_alive, num_ctx):
+        """Starts loading a model on every host out of urls that has it, so the first message doesn't wait for it."""
+        payload = {"model": model, "messages": [], "keep_alive": keep_alive, "options": {"num_ctx": num_ctx}}
+        for url in urls:
+            if self.state(url).has_model(model):
+                task = asyncio.create_task(self._load(url, payload))
+                self.warmups.add(task)
+                task.add_done_callback(self.warmups.discard)
+
+    async def _load(self, url, payload):
+        try:
+            async with self.session.post(f"{url}/api/chat", json=payload) as response:
+                await response.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            pass
+
+    async def probe_loop(self):
+        while True:
+            now = time.monotonic()
+            for url in [url for url, host in self.hosts.items() if now - host.last_used > IDLE_TIMEOUT and not host.in_flight]:
+                del self.hosts[url]
+            await asyncio.gather(*(self.probe(host) for host in list(self.hosts.values())))
+            await asyncio.sleep(PROBE_INTERVAL)
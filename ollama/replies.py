@@ -0,0 +1,70 @@
+from collections import OrderedDict
+
+import discord
+
+MAX_CACHED_MESSAGES = 5000
+MAX_REPLY_DEPTH = 10
+
+
+class MessageNode:
+    __slots__ = ("role", "content", "parent_id")
+
+    def __init__(self, role, content, parent_id):
+        self.role = role
+        self.content = content
+        self.parent_id = parent_id
+
+
+class MessageGraph:
+    """Recently seen messages and what they reply to, so a reply chain can be followed without fetching every message."""
+
+    def __init__(self, max_messages=MAX_CACHED_MESSAGES):
+        self.max_messages = max_messages
+        self.nodes = OrderedDict()
+
+    def __contains__(self, message_id):
+        return message_id in self.nodes
+
+    def add(self, message_id, role, content, parent_id):
+        self.nodes[message_id] = MessageNode(role, content, parent_id)
+        self.nodes.move_to_end(message_id)
+        while len(self.nodes) > self.max_messages:
+            self.nodes.popitem(last=False)
+
+    def edit(self, message_id, content):
+        node = self.nodes.get(message_id)
+        if node is not None:
+            node.content = content
+
+    def discard(self, message_id):
+        self.nodes.pop(message_id, None)
+
+    async def chain(self, message, role_of, max_depth=MAX_REPLY_DEPTH):
+        """The messages above this one in its reply chain as chat turns, oldest first.
+        Messages that aren't cached are fetched and cached, and the chain stops at max_depth,
+        at a deleted message, or at a reply to another channel."""
+        turns = []
+        reference = message.reference
+        parent_id = reference.message_id if reference and reference.channel_id == message.channel.id else None
+        resolved = reference.resolved if reference else None
+        while parent_id is not None and len(turns) < max_depth:
+            node = self.nodes.get(parent_id)
+            if node is None:
+                if isinstance(resolved, discord.Message) and resolved.id == parent_id:
+                    parent = resolved  # discord sends the first hop along with the message
+                else:
+                    try:
+                        parent = await message.channel.fetch_message(parent_id)
+                    except (discord.NotFound, discord.Forbidden):
+                        break
+                parent_reference = parent.reference
+                grandparent_id = parent_reference.message_id if parent_reference and parent_reference.channel_id == message.channel.id else None
+                self.add(parent.id, role_of(parent), parent.content, grandparent_id)
+                node = self.nodes[parent.id]
+            else:
+                self.nodes.move_to_end(parent_id)
+            if node.content:
+                turns.append({"role": node.role, "content": node.content})
+            parent_id = node.parent_id
+            resolved = None
+        return turns[::-1]
@@ -0,0 +1,137 @@
+import asyncio
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+
+class QueueFull(Exception):
+    pass
+
+
+class RequestDropped(Exception):
+    pass
+
+
+class Ticket:
+    def __init__(self, guild_id, user_id, message_id):
+        self.guild_id = guild_id
+        self.user_id = user_id
+        self.message_id = message_id
+        self.future = asyncio.get_running_loop().create_future()
+        self.started = False
+
+
+class BackendQueue:
+    """Lets a limited number of requests run against one backend, and queues the rest.
+    Queued requests take turns between guilds, and between users within a guild."""
+
+    def __init__(self, concurrency, max_depth):
+        self.concurrency = concurrency
+        self.max_depth = max_depth
+        self.running = 0
+        self.waiting = OrderedDict()  # guild -> user -> tickets
+        self.tickets = {}  # waiting tickets in arrival order, used as an ordered set
+
+    @property
+    def depth(self):
+        return len(self.tickets)
+
+    def enqueue(self, ticket):
+        if self.running < self.concurrency and not self.tickets:
+            self._start(ticket)
+            return
+        if self.depth >= self.max_depth:
+            raise QueueFull()
+        users = self.waiting.setdefault(ticket.guild_id, OrderedDict())
+        users.setdefault(ticket.user_id, deque()).append(ticket)
+        self.tickets[ticket] = None
+
+    def position(self, ticket):
+        """Roughly how many requests will start before this one."""
+        return list(self.tickets).index(ticket) + 1 if ticket in self.tickets else 0
+
+    def drop(self, message_id):
+        for ticket in [ticket for ticket in self.tickets if ticket.message_id == message_id]:
+            self._remove(ticket)
+            ticket.future.set_exception(RequestDropped())
+
+    def release(self, ticket):
+        if ticket.started:
+            self.running -= 1
+        elif ticket in self.tickets:
+            self._remove(ticket)
+        self.fill()
+
+    def fill(self):
+        """Starts waiting requests while there is room."""
+        while self.running < self.concurrency and self.waiting:
+            self._start(self._next())
+
+    def _next(self):
+        guild_id, users = self.waiting.popitem(last=False)
+        user_id, tickets = users.popitem(last=False)
+        ticket = tickets.popleft()
+        if tickets:
+            users[user_id] = tickets
+        if users:
+            self.waiting[guild_id] = users
+        del self.tickets[ticket]
+        return ticket
+
+    def _remove(self, ticket):
+        del self.tickets[ticket]
+        users = self.waiting[ticket.guild_id]
+        users[ticket.user_id].remove(ticket)
+        if not users[ticket.user_id]:
+            del users[ticket.user_id]
+        if not users:
+            del self.waiting[ticket.guild_id]
+
+    def _start(self, ticket):
+        ticket.started = True
+        self.running += 1
+        if not ticket.future.done():
+            ticket.future.set_result(None)
+
+
+class RequestScheduler:
+    """Keeps a BackendQueue for each backend, so a burst of messages can't overload a single server."""
+
+    def __init__(self, concurrency=1, max_depth=10):
+        self.concurrency = concurrency
+        self.max_depth = max_depth
+        self.backends = {}
+
+    def configure(self, concurrency, max_depth):
+        self.concurrency = concurrency
+        self.max_depth = max_depth
+        for queue in self.backends.values():
+            queue.concurrency = concurrency
+            queue.max_depth = max_depth
+            queue.fill()
+
+    def load(self, backend):
+        """How many requests are running on or queued for a backend."""
+        queue = self.backends.get(backend)
+        return queue.running + queue.depth if queue is not None else 0
+
+    def drop_message(self, message_id):
+        """Forgets queued requests whose message was deleted."""
+        for queue in self.backends.values():
+            queue.drop(message_id)
+
+    @asynccontextmanager
+    async def slot(self, backend, guild_id, user_id, message_id, on_queued=None):
+        """Waits for a turn to send a request to the backend.
+        Raises QueueFull if too many requests are waiting, or RequestDropped if the message gets deleted while waiting.
+        Requests without a message_id can't be dropped.
+        on_queued is awaited with the queue position if the request has to wait."""
+        queue = self.backends.setdefault(backend, BackendQueue(self.concurrency, self.max_depth))
+        ticket = Ticket(guild_id, user_id, message_id)
+        queue.enqueue(ticket)
+        try:
+            if not ticket.started and on_queued is not None:
+                await on_queued(queue.position(ticket))
+            await ticket.future
+            yield
+        finally:
+            queue.release(ticket)
@@ -0,0 +1,85 @@
+import json
+import time
+
+MESSAGE_LIMIT = 2000
+EDIT_INTERVAL = 1.2  # seconds between edits, discord allows 5 message edits per 5 seconds
+FIRST_MESSAGE_CHARS = 20  # post the first message once this much text has arrived...
+FIRST_MESSAGE_DELAY = 0.5  # ...or once this many seconds have passed since the first token
+
+
+def split_message(text, limit=MESSAGE_LIMIT):
+    """Splits off as much text as fits in one discord message, preferring to break at a newline or space."""
+    if len(text) <= limit:
+        return text, ""
+    cut = text.rfind("\n", 0, limit)
+    if cut <= 0:
+        cut = text.rfind(" ", 0, limit)
+    if cut <= 0:
+        cut = limit
+    return text[:cut], text[cut:].lstrip("\n ")
+
+
+def paginate(text, limit=MESSAGE_LIMIT):
+    pages = []
+    while text:
+        page, text = split_message(text, limit)
+        pages.append(page)
+    return pages
+
+
+async def iter_ndjson(response):
+    """Yields each JSON object of a newline-delimited JSON response as it arrives."""
+    async for line in response.content:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+class MessageStreamer:
+    """Posts a response while it is being generated, editing the message as more text arrives.
+    Edits are throttled to stay under discord's rate limits, and text past 2000 characters continues in a new message."""
+
+    def __init__(self, send):
+        self.send = send
+        self.message = None
+        self.full_text = ""
+        self.text = ""  # text of the current message
+        self.shown = ""  # text the current message is showing
+        self.first_token_at = None
+        self.last_edit = 0.0
+        self.messages = []
+
+    async def feed(self, chunk):
+        if not chunk:
+            return
+        now = time.monotonic()
+        if self.first_token_at is None:
+            self.first_token_at = now
+        self.full_text += chunk
+        self.text += chunk
+        while len(self.text) > MESSAGE_LIMIT:
+            page, self.text = split_message(self.text)
+            await self._show(page)
+            self.message = None
+            self.shown = ""
+        if not self.text.strip():
+            return
+        if self.message is None:
+            if len(self.text) >= FIRST_MESSAGE_CHARS or now - self.first_token_at >= FIRST_MESSAGE_DELAY:
+                await self._show(self.text)
+        elif now - self.last_edit >= EDIT_INTERVAL:
+            await self._show(self.text)
+
+    async def finish(self):
+        """Shows any text that hasn't been shown yet."""
+        if self.text.strip() and self.text != self.shown:
+            await self._show(self.text)
+
+    async def _show(self, text):
+        if self.message is None:
+            self.message = await self.send(text)
+            self.messages.append(self.message)
+        elif text != self.shown:
+            await self.message.edit(content=text)
+        self.shown = text
+        self.last_edit = time.monotonic()
@@ -0,0 +1,75 @@
+from collections import deque
+
+WINDOW = 200  # latest generations kept for each model, guild and server
+METRICS = ("tokens_per_second", "time_to_first_token", "queue_wait", "load_time", "prompt_tokens", "response_tokens")
+
+
+def generation_sample(data, queue_wait, time_to_first_token):
+    """Turns the final object of an /api/chat response into the numbers worth keeping. Ollama reports durations in nanoseconds."""
+    eval_duration = data.get("eval_duration") or 0
+    return {
+        "tokens_per_second": data.get("eval_count", 0) / (eval_duration / 1e9) if eval_duration else None,
+        "time_to_first_token": time_to_first_token,
+        "queue_wait": queue_wait,
+        "load_time": data.get("load_duration", 0) / 1e9,
+        "prompt_tokens": data.get("prompt_eval_count"),
+        "response_tokens": data.get("eval_count"),
+    }
+
+
+def _label(kind, key):
+    return f'{kind}="{str(key).replace(chr(34), "")}"'
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class RollingStats:
+    def __init__(self):
+        self.samples = deque(maxlen=WINDOW)
+        self.total = 0
+
+    def add(self, sample):
+        self.samples.append(sample)
+        self.total += 1
+
+    def summary(self):
+        """Average, median and 95th percentile of each metric over the window."""
+        summary = {}
+        for metric in METRICS:
+            values = [sample[metric] for sample in self.samples if sample[metric] is not None]
+            if values:
+                summary[metric] = (sum(values) / len(values), percentile(values, 0.5), percentile(values, 0.95))
+        return summary
+
+
+class Telemetry:
+    """Rolling numbers about recent generations, grouped by model, guild and server."""
+
+    def __init__(self):
+        self.groups = {"model": {}, "guild": {}, "backend": {}}
+
+    def record(self, model, guild_id, backend, sample):
+        for kind, key in (("model", model), ("guild", guild_id or "DMs"), ("backend", backend)):
+            self.groups[kind].setdefault(key, RollingStats()).add(sample)
+
+    def render(self):
+        """The aggregates in the Prometheus text format."""
+        lines = []
+        for metric in METRICS:
+            lines.append(f"# TYPE ollama_{metric} summary")
+            for kind, groups in self.groups.items():
+                for key, stats in groups.items():
+                    values = stats.summary().get(metric)
+                    if values is None:
+                        continue
+                    labels = _label(kind, key)
+                    lines.append(f'ollama_{metric}{{{labels},quantile="0.5"}} {values[1]:g}')
+                    lines.append(f'ollama_{metric}{{{labels},quantile="0.95"}} {values[2]:g}')
+        lines.append("# TYPE ollama_generations_total counter")
+        for kind, groups in self.groups.items():
+            for key, stats in groups.items():
+                lines.append(f"ollama_generations_total{{{_label(kind, key)}}} {stats.total}")
+        return "\n".join(lines) + "\n"
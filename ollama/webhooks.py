@@ -0,0 +1,58 @@
+import asyncio
+import discord
+
+WEBHOOK_NAME = "Ollama"
+
+
+class WebhookPool:
+    """Keeps one long-lived webhook owned by the bot for each channel, used to send messages with a persona."""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.webhooks = {}
+        self.owned_ids = set()
+        self.locks = {}
+
+    def owns(self, webhook_id):
+        return webhook_id in self.owned_ids
+
+    def invalidate(self, channel_id):
+        self.webhooks.pop(channel_id, None)
+
+    async def get(self, channel):
+        """Finds or creates the bot's webhook for a channel, or returns None if the bot can't manage webhooks there."""
+        if not channel.permissions_for(channel.guild.me).manage_webhooks:
+            return None
+        webhook = self.webhooks.get(channel.id)
+        if webhook is not None:
+            return webhook
+        async with self.locks.setdefault(channel.id, asyncio.Lock()):
+            webhook = self.webhooks.get(channel.id)
+            if webhook is None:
+                webhook = discord.utils.find(lambda w: w.user and w.user.id == self.bot.user.id and w.token,
+                                             await channel.webhooks())
+                if webhook is None:
+                    webhook = await channel.create_webhook(name=WEBHOOK_NAME)
+                self.webhooks[channel.id] = webhook
+                self.owned_ids.add(webhook.id)
+        return webhook
+
+    async def send(self, channel, text, username, avatar_url):
+        """Sends a message through the channel's webhook, or as the bot if there can't be one.
+        Threads use their parent channel's webhook."""
+        thread = channel if isinstance(channel, discord.Thread) else None
+        parent = thread.parent if thread else channel
+        if not isinstance(parent, (discord.TextChannel, discord.ForumChannel, discord.VoiceChannel)):
+            return await channel.send(text)
+        kwargs = {"username": username, "avatar_url": avatar_url, "wait": True}
+        if thread:
+            kwargs["thread"] = thread
+        for _ in range(2):
+            webhook = await self.get(parent)
+            if webhook is None:
+                return await channel.send(text)
+            try:
+                return await webhook.send(text, **kwargs)
+            except discord.NotFound:  # deleted by someone else
+                self.invalidate(parent.id)
+        return await channel.send(text)
@@ -0,0 +1,60 @@
+import pytest
+import regex
+
+from autoreact.matcher import PatternMatcher, PatternStore, required_literal, shadow_evaluate
+
+PATTERNS = [
+    r"(?:hello){e<=1}",
+    r"(?:good morning){e<=2}",
+    r"(?i)(?:good morning){e<=2}",
+    r"(?:cat){s<=1,i<=1}",
+    r"[[:alpha:]]+day",
+    r"(?i)\bhello\b",
+    r"a{2,3}rgh",
+    r"pizza|pasta",
+]
+TEXTS = ["helo", "hello", "hxllo", "god morning", "Good Morning", "gud mornin", "cats", "ct", "Friday", "aaargh",
+         "arghh", "pizza time", "nothing here", ""]
+
+
+@pytest.mark.parametrize("pattern", PATTERNS)
+def test_match_agrees_with_search(pattern):
+    matcher = PatternMatcher(PatternStore())
+    matcher.add("👍", pattern)
+    compiled = regex.compile(pattern)
+    for text in TEXTS:
+        expected = bool(compiled.search(text))
+        assert bool(matcher.match(text, 1.0, 1.0).matches) == expected, text
+
+
+@pytest.mark.parametrize("pattern", [r"(?:hello){e<=1}", r"x{e}", r"[[:digit:]]x", r"a{,}"])
+def test_no_literal_for_regex_only_syntax(pattern):
+    assert required_literal(pattern) is None
+
+
+def test_literal_for_plain_patterns():
+    assert required_literal(r"good\{morning") == "good{morning"
+    assert required_literal(r"a{2}bcd") == "bcd"
+
+
+def test_invalid_patterns_are_kept_aside():
+    store = PatternStore()
+    matcher = PatternMatcher(store)
+    failed = matcher.update({"👍": "good", "🙂": "[[:alpha:]", "😀": "a{1}{e}"})
+    assert failed == {"🙂": "[[:alpha:]", "😀": "a{1}{e}"}
+    assert list(matcher.patterns) == ["👍"] and "🙂" in matcher
+    assert matcher.match("good day", 1.0, 1.0).matches == ["👍"]
+    matcher.add("🙂", "fine")
+    assert "🙂" not in matcher.invalid and matcher.match("fine", 1.0, 1.0).matches == ["🙂"]
+    matcher.remove("😀")
+    matcher.clear()
+    assert not matcher.invalid and not store.references
+
+
+def test_shadow_evaluate_stops_early():
+    slow = regex.compile(r"(a|aa)+$")
+    texts = ["a" * 40 + "b"] * 40
+    result = shadow_evaluate(slow, texts, 0.05, 3, 10.0)
+    assert result.timeouts == 3 and result.evaluated == 3
+    result = shadow_evaluate(slow, texts, 0.05, 100, 0.2)
+    assert result.evaluated < len(texts) and result.total_time < 0.5